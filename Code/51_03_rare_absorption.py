@@ -0,0 +1,88 @@
+
+# ===== paths & files =====
+from pathlib import Path
+import numpy as np,pandas as pd,json
+
+OUT_DIR=Path("outputs/51_C1"); OUT_DIR.mkdir(parents=True,exist_ok=True)
+F_RARE_REP=OUT_DIR/"rare_51_replicates.csv"
+F_RARE_SUM=OUT_DIR/"rare_51_summary.csv"
+F_RARE_TAU=OUT_DIR/"rare_51_tau.csv"
+F_RARE_CFG=OUT_DIR/"rare_51_config.json"
+
+# ===== params =====
+SEED=1; T=30
+ALPHA=0.8; BETA=0.2; THETA1=1.0; THETA2=0.5
+SIGMA_Y=0.05; SIGMA_Z=0.08; S_MEAN=2.2; S_AR=0.85; S_NOISE=0.15
+N_PART=1000        # particles per splitting run
+P0=0.10            # conditional probability targeted per level
+N_MOVES=10         # MCMC moves per level to rejuvenate resampled particles
+RHO=0.8            # pCN correlation of a move: eps' = RHO*eps + sqrt(1-RHO^2)*xi
+N_REP=20           # independent splitting runs -> error bars
+MAX_LEVELS=200
+
+# ===== helpers =====
+def f_I(x): return np.tanh(x)
+def f_Y(x): return x**2
+
+def simulate_batch(E):
+    """simulate() recursion for a batch of noise arrays E (n,3,T): S, Y and Z innovations."""
+    n=E.shape[0]
+    S=np.zeros((n,T+1)); I=np.zeros((n,T+1)); Y=np.zeros((n,T+1)); Z=np.zeros((n,T+1))
+    C=np.zeros((n,T+1),dtype=int); S[:,0]=S_MEAN
+    for t in range(T):
+        S[:,t+1]=S_MEAN*(1-S_AR)+S_AR*S[:,t]+S_NOISE*E[:,0,t]
+        I[:,t+1]=ALPHA*S[:,t]+BETA*C[:,t]
+        Y[:,t+1]=f_I(I[:,t])+SIGMA_Y*E[:,1,t]
+        Z[:,t+1]=f_Y(Y[:,t])+SIGMA_Z*E[:,2,t]
+        C[:,t+1]=np.where((Z[:,t]>THETA1)&(Y[:,t]>THETA2),1,C[:,t])
+    return dict(S=S,I=I,Y=Y,Z=Z,C=C)
+
+def score(X):
+    # signed (Y,Z) distance to the switching region; C(t+1)=1 first happens where score(t)>0
+    return np.minimum(X["Z"][:,:T]-THETA1,X["Y"][:,:T]-THETA2)
+
+def splitting_run(rng,n=N_PART,p0=P0,n_moves=N_MOVES,rho=RHO,max_levels=MAX_LEVELS):
+    """
+    Multilevel splitting in noise space. Levels are adaptive quantiles of the path maximum
+    of score(); survivors of a level are resampled to n particles and rejuvenated by
+    pCN moves that keep N(0,I) invariant and are accepted only above the level.
+    Returns (p_hat, P(C switches at t) for t=1..T, n_levels, particle-steps simulated).
+    """
+    E=rng.standard_normal((n,3,T)); M=score(simulate_batch(E)).max(1); cost=n*T; p=1.0; lv=0
+    while lv<max_levels:
+        L=np.quantile(M,1-p0)
+        if L>=0: break
+        keep=np.flatnonzero(M>L)
+        if keep.size==0: return 0.0,np.zeros(T),lv,cost
+        p*=keep.size/n; lv+=1
+        idx=keep[rng.integers(0,keep.size,n)]; E=E[idx]; M=M[idx]
+        for _ in range(n_moves):
+            Ep=rho*E+np.sqrt(1-rho**2)*rng.standard_normal(E.shape)
+            Mp=score(simulate_batch(Ep)).max(1); cost+=n*T
+            acc=Mp>L; E[acc]=Ep[acc]; M[acc]=Mp[acc]
+    phi=score(simulate_batch(E)); cost+=n*T
+    hit=phi.max(1)>0
+    tau=np.argmax(phi[hit]>0,axis=1)+1
+    p_t=p*np.bincount(tau,minlength=T+1)[1:]/n
+    return float(p*hit.mean()),p_t,lv,cost
+
+# ===== main =====
+if __name__=="__main__":
+    ss=np.random.SeedSequence(SEED); reps=[]; taus=[]
+    for r,child in enumerate(ss.spawn(N_REP)):
+        p,pt,lv,cost=splitting_run(np.random.default_rng(child))
+        reps.append(dict(rep=r,p_hat=p,n_levels=lv,cost=cost)); taus.append(pt)
+    rep=pd.DataFrame(reps); rep.to_csv(F_RARE_REP,index=False)
+    p_mean=float(rep["p_hat"].mean()); se=float(rep["p_hat"].std(ddof=1)/np.sqrt(N_REP))
+    cost=int(rep["cost"].sum()); re=se/p_mean if p_mean>0 else np.nan
+    # plain MC steps for the same relative error: T*(1-p)/(p*re^2)
+    mc_cost=T*(1-p_mean)/(p_mean*re**2) if p_mean>0 and re>0 else np.nan
+    pd.DataFrame([dict(p_hat=p_mean,se=se,lo=p_mean-1.96*se,hi=p_mean+1.96*se,rel_err=re,
+                       cost=cost,mc_equiv_cost=mc_cost)]).to_csv(F_RARE_SUM,index=False)
+    taus=np.asarray(taus)
+    pd.DataFrame(dict(t=np.arange(1,T+1),p_absorb_at_t=taus.mean(0),
+                      se=taus.std(0,ddof=1)/np.sqrt(N_REP))).to_csv(F_RARE_TAU,index=False)
+    json.dump(dict(seed=SEED,T=T,alpha=ALPHA,beta=BETA,theta1=THETA1,theta2=THETA2,
+                   sigma_y=SIGMA_Y,sigma_z=SIGMA_Z,n_part=N_PART,p0=P0,n_moves=N_MOVES,rho=RHO,n_rep=N_REP),
+              open(F_RARE_CFG,"w",encoding="utf-8"),indent=2,ensure_ascii=False)
+    print("[51_03] rare-event estimates exported:",F_RARE_SUM,F_RARE_TAU)
@@ -8,6 +8,8 @@ OUT_DIR.mkdir(parents=True, exist_ok=True)
 F_SERIES_BASE   = OUT_DIR / "series_52_baseline.csv"
 F_SERIES_DO     = OUT_DIR / "series_52_do.csv"
 F_TABLE_METRICS = OUT_DIR / "table_52_metrics.csv"
+F_TABLE_GRID    = OUT_DIR / "table_52_metrics_grid.csv"
+F_STATS         = OUT_DIR / "stats_52_ensemble.csv"
 F_FIG_A_PNG     = OUT_DIR / "fig_52a_baseline.png"
 F_FIG_A_PDF     = OUT_DIR / "fig_52a_baseline.pdf"
 F_FIG_B_PNG     = OUT_DIR / "fig_52b_do.png"
@@ -31,6 +33,17 @@ S_AR = 0.85
 S_NOISE_STD = 0.15
 DO_T = 13          # intervention time index (affects t+1)
 DO_DELTA_I = 0.6    
+# intervention sweep: every (do_t, delta) branch forks from the shared baseline prefix
+DO_T_GRID = list(range(T_HORIZON))                       # None disables the grid table
+DO_DELTA_GRID = [round(0.02*k, 2) for k in range(1, 51)]
+# streaming ensemble: series/metrics are views over per-time-step accumulators
+ENSEMBLE_SEEDS = [SEED]
+ENSEMBLE_BATCH = 100_000
+SERIES_VARS = ("S", "I", "Y", "Z", "C")
+Q_LEVELS = (0.05, 0.5, 0.95)
+Q_BINS = 512                    # fixed-range histogram sketch; out-of-range values land in the edge bins
+Q_RANGE = {"S": (0.0, 4.5), "I": (-0.5, 4.0), "Y": (-1.5, 1.5), "Z": (-0.5, 3.0), "C": (0.0, 1.0),
+           "dI": (-2.0, 2.0), "dY": (-2.0, 2.0), "dZ": (-2.0, 2.0)}
 
 # ===== helpers =====
 import json, time
@@ -39,6 +52,9 @@ import pandas as pd
 
 def f_I(x): return np.tanh(x)   
 def f_Y(x): return x**2         
+# scalar f_Y goes through pow(), which differs from array x**2 (== x*x) in the last ulp for
+# ~0.1% of inputs; float_power takes the same pow() path, keeping the ensemble seed-for-seed
+def f_Y_vec(x): return np.float_power(x, 2)
 
 def gen_S(T, seed):
     rng = np.random.default_rng(seed)
@@ -58,6 +74,30 @@ def sim_baseline(T=T_HORIZON, seed=SEED):
         C[t+1] = 1 if (Z[t] > THETA1 and Y[t] > THETA2) else C[t]
     return pd.DataFrame({"t": np.arange(T+1), "S": S, "I": I, "Y": Y, "Z": Z, "C": C})
 
+def draw_noise(seeds, T):
+    # one default_rng(seed) stream per seed: S uses draws [0, T), the chain uses [0, 2T) as (Y, Z) pairs.
+    # Per-seed streams cannot be drawn in one call; the loop is the price of seed-for-seed equality.
+    eps = np.empty((len(seeds), 2*T))
+    for k, s in enumerate(seeds):
+        eps[k] = np.random.default_rng(s).standard_normal(2*T)
+    return eps
+
+def sim_baseline_ensemble(seeds, T=T_HORIZON, do_t=None, do_delta=0.0):
+    """Batched sim_baseline (sim_do when do_t is set): (N, T+1) arrays S, I, Y, Z, C, seed-for-seed identical."""
+    eps = draw_noise(seeds, T); N = eps.shape[0]
+    S = np.empty((N, T+1)); S[:, 0] = S_MEAN
+    for t in range(1, T+1):
+        S[:, t] = S_MEAN*(1 - S_AR) + S_AR*S[:, t-1] + S_NOISE_STD*eps[:, t-1]
+    I = np.zeros((N, T+1)); Y = np.zeros((N, T+1)); Z = np.zeros((N, T+1)); C = np.zeros((N, T+1), dtype=int)
+    for t in range(T):
+        I[:, t+1] = ALPHA*S[:, t] + BETA*C[:, t]
+        if t == do_t:
+            I[:, t+1] = I[:, t+1] + do_delta
+        Y[:, t+1] = f_I(I[:, t]) + SIGMA_Y*eps[:, 2*t]
+        Z[:, t+1] = f_Y_vec(Y[:, t]) + SIGMA_Z*eps[:, 2*t+1]
+        C[:, t+1] = np.where((Z[:, t] > THETA1) & (Y[:, t] > THETA2), 1, C[:, t])
+    return {"S": S, "I": I, "Y": Y, "Z": Z, "C": C}
+
 def sim_do(T=T_HORIZON, seed=SEED):
     rng = np.random.default_rng(seed)
     S = gen_S(T, seed)
@@ -74,32 +114,155 @@ def sim_do(T=T_HORIZON, seed=SEED):
 def variability_std(df):
     return float(np.nanstd(df[["I","Y","Z"]].values))
 
-# ===== main =====
-if __name__ == "__main__":
-    t0 = time.time()
-    df_base = sim_baseline()
-    df_do   = sim_do()
+def sim_do_grid(do_ts, deltas, T=T_HORIZON, seed=SEED):
+    """All (do_t, delta) interventions in one pass, with common random numbers.
 
-    df_base.to_csv(F_SERIES_BASE, index=False)
-    df_do.to_csv(F_SERIES_DO, index=False)
+    Branches start as copies of the baseline; at step t only branches with do_t <= t
+    are advanced, so each one is forked from the baseline state (and RNG position
+    2*do_t) at its own intervention time. Row k equals sim_do with DO_T=do_t[k],
+    DO_DELTA_I=delta[k].
+    """
+    base = sim_baseline_ensemble([seed], T)
+    eps = draw_noise([seed], T)[0]
+    do_t = np.repeat(np.sort(np.asarray(do_ts, dtype=int)), len(deltas))
+    dlt = np.tile(np.asarray(deltas, dtype=float), len(do_ts))
+    nb = do_t.size
+    S = base["S"][0]
+    I = np.repeat(base["I"], nb, axis=0); Y = np.repeat(base["Y"], nb, axis=0)
+    Z = np.repeat(base["Z"], nb, axis=0); C = np.repeat(base["C"], nb, axis=0)
+    for t in range(int(do_t.min()) if nb else T, T):
+        n = int(np.searchsorted(do_t, t, side="right"))     # branches forked by step t
+        r = slice(0, n)
+        I[r, t+1] = ALPHA*S[t] + BETA*C[r, t]
+        hit = do_t[r] == t
+        I[r, t+1][hit] = I[r, t+1][hit] + dlt[r][hit]
+        Y[r, t+1] = f_I(I[r, t]) + SIGMA_Y*eps[2*t]
+        Z[r, t+1] = f_Y_vec(Y[r, t]) + SIGMA_Z*eps[2*t+1]
+        C[r, t+1] = np.where((Z[r, t] > THETA1) & (Y[r, t] > THETA2), 1, C[r, t])
+    return base, {"do_t": do_t, "delta": dlt, "I": I, "Y": Y, "Z": Z, "C": C}
 
-    dI = df_do["I"].to_numpy() - df_base["I"].to_numpy()
-    dY = df_do["Y"].to_numpy() - df_base["Y"].to_numpy()
-    dZ = df_do["Z"].to_numpy() - df_base["Z"].to_numpy()
-
-    m_base = variability_std(df_base)
-    m_do   = variability_std(df_do)
-
-    pd.DataFrame([{
+def grid_metrics(base, br):
+    """table_52_metrics columns, one row per branch."""
+    def _std(I, Y, Z): return np.nanstd(np.concatenate([I, Y, Z], axis=1), axis=1)
+    m_base = float(_std(base["I"], base["Y"], base["Z"])[0])
+    m_do = _std(br["I"], br["Y"], br["Z"])
+    return pd.DataFrame({
         "baseline_std": m_base,
         "do_std": m_do,
         "delta_std": m_do - m_base,
-        "max_abs_delta_I": float(np.max(np.abs(dI))),
-        "max_abs_delta_Y": float(np.max(np.abs(dY))),
-        "max_abs_delta_Z": float(np.max(np.abs(dZ))),
-        "do_time": DO_T,
-        "do_delta_I": DO_DELTA_I
-    }]).to_csv(F_TABLE_METRICS, index=False)
+        "max_abs_delta_I": np.abs(br["I"] - base["I"]).max(axis=1),
+        "max_abs_delta_Y": np.abs(br["Y"] - base["Y"]).max(axis=1),
+        "max_abs_delta_Z": np.abs(br["Z"] - base["Z"]).max(axis=1),
+        "do_time": br["do_t"],
+        "do_delta_I": br["delta"],
+    })
+
+# ----- streaming ensemble statistics -----
+def acc_new(var, T=T_HORIZON, bins=Q_BINS):
+    lo, hi = Q_RANGE[var]
+    return {"n": 0, "mean": np.zeros(T+1), "m2": np.zeros(T+1),
+            "min": np.full(T+1, np.inf), "max": np.full(T+1, -np.inf),
+            "hist": np.zeros((T+1, bins), dtype=np.int64), "lo": lo, "hi": hi}
+
+def _acc_combine(a, nb, mb, m2b):
+    # Chan et al. pairwise update of (n, mean, M2); exact mean for the first single run
+    n = a["n"]; tot = n + nb; d = mb - a["mean"]
+    a["mean"] = a["mean"] + d*nb/tot
+    a["m2"] = a["m2"] + m2b + d**2*n*nb/tot
+    a["n"] = tot
+
+def acc_update(a, X):
+    """Fold a batch of trajectories X (N, T+1) into accumulator a."""
+    X = np.asarray(X, dtype=float)
+    mb = X.mean(axis=0)
+    _acc_combine(a, X.shape[0], mb, ((X - mb)**2).sum(axis=0))
+    a["min"] = np.minimum(a["min"], X.min(axis=0)); a["max"] = np.maximum(a["max"], X.max(axis=0))
+    bins = a["hist"].shape[1]
+    b = np.clip(((X - a["lo"])/(a["hi"] - a["lo"])*bins).astype(np.int64), 0, bins - 1)
+    a["hist"] += np.bincount((np.arange(X.shape[1])*bins + b).ravel(),
+                             minlength=a["hist"].size).reshape(a["hist"].shape)
+    return a
+
+def acc_merge(a, b):
+    """Merge accumulator b (e.g. from another worker) into a."""
+    if b["n"] == 0: return a
+    _acc_combine(a, b["n"], b["mean"], b["m2"])
+    a["min"] = np.minimum(a["min"], b["min"]); a["max"] = np.maximum(a["max"], b["max"])
+    a["hist"] += b["hist"]
+    return a
+
+def acc_quantile(a, q):
+    bins = a["hist"].shape[1]; w = (a["hi"] - a["lo"])/bins
+    cum = np.cumsum(a["hist"], axis=1); k = q*a["n"]
+    j = np.minimum((cum < k).sum(axis=1), bins - 1)
+    below = np.where(j > 0, cum[np.arange(cum.shape[0]), j - 1], 0)
+    inbin = a["hist"][np.arange(cum.shape[0]), j]
+    frac = np.divide(k - below, inbin, out=np.zeros(j.shape), where=inbin > 0)
+    return np.clip(a["lo"] + (j + frac)*w, a["min"], a["max"])
+
+def stream_ensemble(seeds, batch=ENSEMBLE_BATCH):
+    """Accumulators for baseline, do and paired do-baseline differences, in constant memory."""
+    acc = {"base": {v: acc_new(v) for v in SERIES_VARS}, "do": {v: acc_new(v) for v in SERIES_VARS},
+           "diff": {v: acc_new("d" + v) for v in ("I", "Y", "Z")}}
+    seeds = list(seeds)
+    for i in range(0, len(seeds), batch):
+        sb = seeds[i:i+batch]
+        rb = sim_baseline_ensemble(sb); rd = sim_baseline_ensemble(sb, do_t=DO_T, do_delta=DO_DELTA_I)
+        for v in SERIES_VARS:
+            acc_update(acc["base"][v], rb[v]); acc_update(acc["do"][v], rd[v])
+        for v in ("I", "Y", "Z"):
+            acc_update(acc["diff"][v], rd[v] - rb[v])
+    return acc
+
+def series_view(acc_run):
+    """series_52_* layout: per-t ensemble mean (the trajectory itself for a single seed)."""
+    out = {"t": np.arange(T_HORIZON+1)}
+    for v in SERIES_VARS:
+        m = acc_run[v]["mean"]
+        out[v] = m.astype(int) if (v == "C" and acc_run[v]["n"] == 1) else m
+    return pd.DataFrame(out)
+
+def pooled_std_view(acc_run):
+    """std over all I/Y/Z values of all runs (variability_std for a single seed)."""
+    n = np.concatenate([np.full(T_HORIZON+1, float(acc_run[v]["n"])) for v in ("I", "Y", "Z")])
+    mean = np.concatenate([acc_run[v]["mean"] for v in ("I", "Y", "Z")])
+    m2 = np.concatenate([acc_run[v]["m2"] for v in ("I", "Y", "Z")])
+    grand = (n*mean).sum()/n.sum()
+    return float(np.sqrt((m2 + n*(mean - grand)**2).sum()/n.sum()))
+
+def metrics_view(acc):
+    m_base = pooled_std_view(acc["base"]); m_do = pooled_std_view(acc["do"])
+    row = {"baseline_std": m_base, "do_std": m_do, "delta_std": m_do - m_base}
+    for v in ("I", "Y", "Z"):
+        d = acc["diff"][v]
+        row[f"max_abs_delta_{v}"] = float(np.maximum(np.abs(d["min"]), np.abs(d["max"])).max())
+    row.update({"do_time": DO_T, "do_delta_I": DO_DELTA_I})
+    return pd.DataFrame([row])
+
+def stats_view(acc):
+    rows = []
+    for run, accs in acc.items():
+        for v, a in accs.items():
+            d = {"run": run, "var": v, "t": np.arange(T_HORIZON+1), "n": a["n"], "mean": a["mean"],
+                 "std": np.sqrt(a["m2"]/a["n"]), "min": a["min"], "max": a["max"]}
+            for q in Q_LEVELS:
+                d[f"q{int(round(q*100)):02d}"] = acc_quantile(a, q)
+            rows.append(pd.DataFrame(d))
+    return pd.concat(rows, ignore_index=True)
+
+# ===== main =====
+if __name__ == "__main__":
+    t0 = time.time()
+    acc = stream_ensemble(ENSEMBLE_SEEDS)
+
+    series_view(acc["base"]).to_csv(F_SERIES_BASE, index=False)
+    series_view(acc["do"]).to_csv(F_SERIES_DO, index=False)
+    metrics_view(acc).to_csv(F_TABLE_METRICS, index=False)
+    stats_view(acc).to_csv(F_STATS, index=False)
+
+    if DO_T_GRID is not None:
+        base, br = sim_do_grid(DO_T_GRID, DO_DELTA_GRID)
+        grid_metrics(base, br).to_csv(F_TABLE_GRID, index=False)
 
     with open(F_CONFIG, "w", encoding="utf-8") as f:
         json.dump({
@@ -3,6 +3,9 @@
 from pathlib import Path
 OUT_DIR = Path("outputs/52_C2"); OUT_DIR.mkdir(parents=True, exist_ok=True)
 F_PIVOT_CSV = OUT_DIR / "sensitivity_52_pivot.csv"
+F_SWEEP_CSV = OUT_DIR / "sensitivity_52_sweep.csv"
+SWEEP_DIR   = OUT_DIR / "sweep_52"              # chunked parts + manifest (resumable)
+F_MANIFEST  = SWEEP_DIR / "manifest.json"
 
 # ===== params =====
 SEED = 1
@@ -17,13 +20,29 @@ S_NOISE_STD = 0.15
 SIGMA_Y_LIST = [0.02, 0.05, 0.1, 0.2, 0.3]
 SIGMA_Z_LIST = [0.02, 0.05, 0.1, 0.2, 0.3]
 
+# sweep: any subset of BASE_PARAMS keys -> value list; cells = cartesian product
+BASE_PARAMS = {
+    "ALPHA": ALPHA, "BETA": BETA, "THETA1": THETA1, "THETA2": THETA2,
+    "SIGMA_Y": 0.05, "SIGMA_Z": 0.08,
+    "S_MEAN": S_MEAN, "S_AR": S_AR, "S_NOISE": S_NOISE_STD, "T": T_HORIZON,
+}
+SWEEP = {"SIGMA_Y": SIGMA_Y_LIST, "SIGMA_Z": SIGMA_Z_LIST}
+SEEDS = [SEED]                                  # replicates per cell (common random numbers across cells)
+CHUNK_CELLS = 256                               # cells per part file
+SEED_BLOCK = 10_000                             # seeds whose noise is held at once inside a chunk
+N_WORKERS = 1                                   # >1 spreads chunks over a process pool
+
 # ===== helpers =====
+import json
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
 def f_I(x): return np.tanh(x)
 def f_Y(x): return x**2
+# scalar f_Y goes through pow(), which differs from array x**2 (== x*x) in the last ulp for
+# ~0.1% of inputs; float_power takes the same pow() path, keeping the ensemble seed-for-seed
+def f_Y_vec(x): return np.float_power(x, 2)
 
 def gen_S(T, seed):
     rng = np.random.default_rng(seed)
@@ -43,20 +62,156 @@ def sim_ordered(T, sigma_y, sigma_z, seed=SEED):
         C[t+1] = 1 if (Z[t] > THETA1 and Y[t] > THETA2) else C[t]
     return pd.DataFrame({"I": I, "Y": Y, "Z": Z})
 
+def draw_noise(seeds, T):
+    # one default_rng(seed) stream per seed, as sim_ordered draws; per-seed streams cannot be
+    # drawn in one call, so the loop is the price of seed-for-seed equality
+    eps = np.empty((len(seeds), 2*T))
+    for k, s in enumerate(seeds):
+        eps[k] = np.random.default_rng(s).standard_normal(2*T)
+    return eps
+
+def sim_params_ensemble(p, eps):
+    """Chain under parameter dict p (BASE_PARAMS keys) for pre-drawn noise eps (N, >=2T)."""
+    T = int(p["T"]); N = eps.shape[0]
+    S = np.empty((N, T+1)); S[:, 0] = p["S_MEAN"]
+    for t in range(1, T+1):
+        S[:, t] = p["S_MEAN"]*(1 - p["S_AR"]) + p["S_AR"]*S[:, t-1] + p["S_NOISE"]*eps[:, t-1]
+    I = np.zeros((N, T+1)); Y = np.zeros((N, T+1)); Z = np.zeros((N, T+1)); C = np.zeros((N, T+1), dtype=int)
+    for t in range(T):
+        I[:, t+1] = p["ALPHA"]*S[:, t] + p["BETA"]*C[:, t]
+        Y[:, t+1] = f_I(I[:, t]) + p["SIGMA_Y"]*eps[:, 2*t]
+        Z[:, t+1] = f_Y_vec(Y[:, t]) + p["SIGMA_Z"]*eps[:, 2*t+1]
+        C[:, t+1] = np.where((Z[:, t] > p["THETA1"]) & (Y[:, t] > p["THETA2"]), 1, C[:, t])
+    return {"I": I, "Y": Y, "Z": Z, "C": C}
+
+def sim_ordered_ensemble(T, sigma_y, sigma_z, seeds):
+    """Batched sim_ordered over seeds: (N, T+1) arrays I, Y, Z, seed-for-seed identical."""
+    p = dict(BASE_PARAMS, T=T, SIGMA_Y=sigma_y, SIGMA_Z=sigma_z)
+    return sim_params_ensemble(p, draw_noise(seeds, T))
+
+def variability_std_ensemble(res):
+    return np.nanstd(np.concatenate([res["I"], res["Y"], res["Z"]], axis=1), axis=1)
+
 def variability_std(df):
     return float(np.nanstd(df[["I","Y","Z"]].values))
 
+# ----- streaming per-cell statistics (as acc_* in 52_01, one scalar per seed) -----
+def acc_new(n_cells):
+    return {"n": 0, "mean": np.zeros(n_cells), "m2": np.zeros(n_cells), "absorbed": np.zeros(n_cells)}
+
+def _acc_combine(a, nb, mb, m2b):
+    # Chan et al. pairwise update of (n, mean, M2), shared by every cell of the chunk
+    n = a["n"]; tot = n + nb; d = mb - a["mean"]
+    a["mean"] = a["mean"] + d*nb/tot
+    a["m2"] = a["m2"] + m2b + d**2*n*nb/tot
+    a["n"] = tot
+
+def acc_update(a, V, C_end):
+    """Fold a seed block into a: V (n_cells, N) variability per seed, C_end (n_cells, N) absorbed at T."""
+    mb = V.mean(axis=1)
+    _acc_combine(a, V.shape[1], mb, ((V - mb[:, None])**2).sum(axis=1))
+    a["absorbed"] += C_end.sum(axis=1)
+    return a
+
+def acc_merge(a, b):
+    """Merge accumulator b (e.g. another worker's seeds for the same cells) into a."""
+    if b["n"] == 0: return a
+    _acc_combine(a, b["n"], b["mean"], b["m2"])
+    a["absorbed"] = a["absorbed"] + b["absorbed"]
+    return a
+
+# ----- sweep engine -----
+def sweep_cells(sweep=SWEEP):
+    keys = list(sweep)
+    grids = np.meshgrid(*[np.asarray(sweep[k], dtype=float) for k in keys], indexing="ij")
+    return keys, np.stack([g.ravel() for g in grids], axis=1)
+
+def _part_path(chunk_id):
+    return SWEEP_DIR / f"part_{chunk_id:06d}.npz"
+
+def run_chunk(chunk_id, keys, vals, seeds):
+    """
+    Simulate one chunk of cells and write it as a columnar part file (atomic rename).
+    Seeds are taken SEED_BLOCK at a time: each block's noise is drawn once per
+    horizon T and shared by every cell of the chunk, then folded into the
+    per-cell accumulators and dropped, so memory does not grow with the seeds.
+    """
+    n = vals.shape[0]
+    out = {"cell": np.arange(chunk_id*CHUNK_CELLS, chunk_id*CHUNK_CELLS + n),
+           "std_mean": np.empty(n), "std_sd": np.empty(n),
+           "absorb_rate": np.empty(n), "n_seeds": np.full(n, len(seeds))}
+    params = [dict(BASE_PARAMS, **dict(zip(keys, vals[i]))) for i in range(n)]
+    acc = acc_new(n)
+    for b in range(0, len(seeds), SEED_BLOCK):
+        sb = seeds[b:b+SEED_BLOCK]; eps = {}
+        V = np.empty((n, len(sb))); C_end = np.empty((n, len(sb)))
+        for i, p in enumerate(params):
+            T = int(p["T"])
+            if T not in eps: eps[T] = draw_noise(sb, T)
+            res = sim_params_ensemble(p, eps[T])
+            V[i] = variability_std_ensemble(res); C_end[i] = res["C"][:, -1]
+        acc_update(acc, V, C_end)
+    out["std_mean"][:] = acc["mean"]; out["std_sd"][:] = np.sqrt(acc["m2"]/max(acc["n"], 1))
+    out["absorb_rate"][:] = acc["absorbed"]/max(acc["n"], 1)
+    for j, k in enumerate(keys):
+        out[k] = vals[:, j]
+    tmp = SWEEP_DIR / f".part_{chunk_id:06d}.tmp.npz"
+    np.savez(tmp, **out)
+    tmp.replace(_part_path(chunk_id))
+    return chunk_id
+
+def _run_chunk_args(a):
+    return run_chunk(*a)
+
+def _check_manifest(sweep, keys, vals, seeds):
+    """Keep the part files only if they were written for this exact sweep; otherwise drop them."""
+    man = {"keys": keys, "n_cells": int(vals.shape[0]), "chunk_cells": CHUNK_CELLS,
+           "seeds": [int(s) for s in seeds], "base": BASE_PARAMS,
+           "grid": {k: [float(x) for x in sweep[k]] for k in keys}}
+    SWEEP_DIR.mkdir(parents=True, exist_ok=True)
+    if F_MANIFEST.exists():
+        old = json.loads(F_MANIFEST.read_text(encoding="utf-8"))
+        if old == json.loads(json.dumps(man)):
+            return
+        stale = sorted(SWEEP_DIR.glob("part_*.npz"))
+        print(f"[52] {SWEEP_DIR} holds a different sweep; dropping {len(stale)} old parts")
+        for f in stale: f.unlink()
+    F_MANIFEST.write_text(json.dumps(man, indent=2), encoding="utf-8")
+
+def run_sweep(sweep=SWEEP, seeds=SEEDS, n_workers=N_WORKERS):
+    """Run (or resume) the sweep; chunks whose part file exists are skipped."""
+    keys, vals = sweep_cells(sweep)
+    _check_manifest(sweep, keys, vals, seeds)
+    n_chunks = -(-vals.shape[0] // CHUNK_CELLS)
+    todo = [c for c in range(n_chunks) if not _part_path(c).exists()]
+    print(f"[52] sweep cells={vals.shape[0]} chunks={n_chunks} todo={len(todo)} seeds={len(seeds)}")
+    args = [(c, keys, vals[c*CHUNK_CELLS:(c+1)*CHUNK_CELLS], list(seeds)) for c in todo]
+    if n_workers > 1 and len(args) > 1:
+        import multiprocessing as mp
+        with mp.get_context("spawn").Pool(processes=n_workers) as pool:
+            for _ in tqdm(pool.imap_unordered(_run_chunk_args, args), total=len(args), desc="chunks"):
+                pass
+    else:
+        for a in tqdm(args, desc="chunks"):
+            run_chunk(*a)
+    return load_sweep(n_chunks)
+
+def load_sweep(n_chunks):
+    parts = []
+    for c in range(n_chunks):
+        with np.load(_part_path(c)) as z:
+            parts.append(pd.DataFrame({k: z[k] for k in z.files}))
+    return pd.concat(parts, ignore_index=True).sort_values("cell").reset_index(drop=True)
+
 # ===== main =====
 if __name__ == "__main__":
     print("[52] start sensitivity scan …")
-    results = []
-    for sy in tqdm(SIGMA_Y_LIST, desc="sigma_y"):
-        row = {}
-        for sz in SIGMA_Z_LIST:
-            df = sim_ordered(T=T_HORIZON, sigma_y=sy, sigma_z=sz)
-            row[sz] = variability_std(df)
-        results.append(row)
-    pv = pd.DataFrame(results, index=SIGMA_Y_LIST)
-    pv.index.name = "sigma_y"
-    pv.to_csv(F_PIVOT_CSV)
-    print(f"[52] sensitivity pivot saved: {F_PIVOT_CSV}")
+    res = run_sweep()
+    res.to_csv(F_SWEEP_CSV, index=False)
+    print(f"[52] sweep table saved: {F_SWEEP_CSV}")
+    keys = list(SWEEP)
+    if len(keys) == 2:
+        pv = res.pivot(index=keys[0], columns=keys[1], values="std_mean")
+        pv.index.name = keys[0].lower(); pv.columns.name = None
+        pv.to_csv(F_PIVOT_CSV)
+        print(f"[52] sensitivity pivot saved: {F_PIVOT_CSV}")
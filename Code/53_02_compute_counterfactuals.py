@@ -8,6 +8,7 @@ F_DO_NOA2B  = OUT_DIR / "53_do__NoAtoB.csv"
 F_DO_NOB2C  = OUT_DIR / "53_do__NoBtoC.csv"
 F_DO_NOC2D  = OUT_DIR / "53_do__NoCtoD.csv"
 F_DO_NONE   = OUT_DIR / "53_do__None.csv"
+F_DO_ALL    = OUT_DIR / "53_do__ALL.csv"        # every ablation, long format with run_tag
 
 # ===== params =====
 BASE_B = 0.50; BASE_C = 0.40; BASE_D = 0.30; BASE_E = 0.20
@@ -18,8 +19,10 @@ TONIC_B = 0.05; TONIC_C = 0.04; TONIC_D = 0.03; TONIC_E = 0.02
 
 T_COL="t"; A_FLAG="A_low"
 B_CF="B_hat_cf"; C_CF="C_hat_cf"; D_CF="D_hat_cf"; E_CF="E_hat_cf"
+FFT_MIN = 64   # kernels with more non-zero lags than this are applied by FFT convolution
 
 # ===== helpers =====
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
@@ -38,6 +41,73 @@ def simulate_with_A(A_series, cut_AtoB=False, cut_BtoC=False, cut_CtoD=False):
         rows.append((t, B, C, D, E))
     return pd.DataFrame(rows, columns=[T_COL, B_CF, C_CF, D_CF, E_CF])
 
+# ----- closed-form impulse response: v_t = c + F v_{t-1} + g A_{t-1}, v=(B,C,D,E) -----
+# kept line-for-line with the copy in 54_02 (scripts are standalone); trajectories agree with the
+# step-by-step simulate_with_A to ~1e-16, not bitwise, because (I-Kc)^-1 reorders the sums.
+# The FFT branch (long kernels, i.e. phi > 0) is accurate to ~1e-15 of each series' largest value, so entries far
+# below it lose relative accuracy as phi -> 1: 8e-10 at phi=0.99/T=1000, 2e-7 at phi=0.999/T=2000.
+# Raise FFT_MIN above T to force the direct sum (~1e-14 relative in both cases).
+def ir_system(cut_AtoB=False, cut_BtoC=False, cut_CtoD=False):
+    Kc = np.zeros((4, 4))   # same-step B->C->D->E, as in simulate_with_A (no PHI terms here)
+    Kc[1, 0] = 0.0 if cut_BtoC else K_CB
+    Kc[2, 1] = 0.0 if cut_CtoD else K_DC; Kc[2, 0] = K_DB
+    Kc[3, 2] = K_ED; Kc[3, 1] = K_EC; Kc[3, 0] = K_EB
+    base = np.array([BASE_B, BASE_C, BASE_D, BASE_E]); tonic = np.array([TONIC_B, TONIC_C, TONIC_D, TONIC_E])
+    kA = np.array([0.0 if cut_AtoB else K_AB, K_CA, K_DA, K_EA])
+    M = np.linalg.inv(np.eye(4) - Kc)
+    return M @ (base + tonic), np.zeros((4, 4)), M @ kA, base
+
+def ir_kernels(system, T):
+    """Free response (T+1,4) from the baselines and A->(B,C,D,E) kernel (T,4), h_j = F^j g."""
+    c, F, g, v0 = system
+    free = np.empty((T+1, 4)); kern = np.empty((T, 4)); free[0] = v0; h = g.copy()
+    for t in range(1, T+1): free[t] = c + F @ free[t-1]
+    for j in range(T): kern[j] = h; h = F @ h
+    return free, kern
+
+def ir_apply(A, free, kern, fft_min=FFT_MIN):
+    """
+    Trajectories (N,T+1,4) for a batch of A series (N,T+1): free[t] + sum_j kern[j]*A[t-1-j].
+    free/kern may carry a leading tag axis (J,T+1,4)/(J,T,4); the result is then (J,N,T+1,4).
+    Series holding NaN take the direct sum, so the NaN reaches only later steps, as in simulate_with_A.
+    """
+    A = np.atleast_2d(np.asarray(A, dtype=float)); N, T1 = A.shape; T = T1 - 1
+    lead = free.shape[:-2]
+    nz = np.flatnonzero(np.abs(kern[..., :T, :]).reshape(-1, T, 4).max(axis=(0, 2)) > 0) if T else np.array([], dtype=int)
+    L = int(nz[-1]) + 1 if nz.size else 0
+    out = np.broadcast_to(free[..., None, :T1, :], lead + (N, T1, 4)).copy()
+    fft = np.zeros(N, dtype=bool) if L <= fft_min else ~np.isnan(A[:, :T]).any(axis=1)
+    if fft.any():
+        n = 1 << int(np.ceil(np.log2(2*T)))
+        fk = np.fft.rfft(kern[..., :T, :], n, axis=-2)[..., None, :, :]
+        conv = np.fft.irfft(np.fft.rfft(A[fft, :T], n, axis=1)[:, :, None] * fk, n, axis=-2)
+        out[..., fft, 1:, :] += conv[..., :T, :]
+    if not fft.all():
+        d = ~fft; Ad = A[d]; od = out[..., d, :, :]
+        for j in range(L): od[..., j+1:, :] += Ad[:, :T-j, None] * kern[..., j, None, None, :]
+        out[..., d, :, :] = od
+    return out
+
+_IR_CACHE = {}
+def simulate_with_A_batch(A_batch, cut_AtoB=False, cut_BtoC=False, cut_CtoD=False):
+    """simulate_with_A for many A series at once; kernels are built once per (cuts, T)."""
+    A_batch = np.atleast_2d(np.asarray(A_batch, dtype=float)); T = A_batch.shape[1] - 1
+    key = (cut_AtoB, cut_BtoC, cut_CtoD, T)
+    if key not in _IR_CACHE: _IR_CACHE[key] = ir_kernels(ir_system(cut_AtoB, cut_BtoC, cut_CtoD), T)
+    return ir_apply(A_batch, *_IR_CACHE[key])
+
+def simulate_with_A_tags(A_batch, cuts):
+    """
+    All ablations in one pass. cuts: (J,3) mask of (cut_AtoB, cut_BtoC, cut_CtoD) per tag.
+    Kernels are stacked to (J,T,4) and applied together; returns (J,N,T+1,4).
+    """
+    A_batch = np.atleast_2d(np.asarray(A_batch, dtype=float)); T = A_batch.shape[1] - 1
+    for c in cuts:
+        key = (*map(bool, c), T)
+        if key not in _IR_CACHE: _IR_CACHE[key] = ir_kernels(ir_system(*key[:3]), T)
+    free, kern = (np.stack(x) for x in zip(*(_IR_CACHE[(*map(bool, c), T)] for c in cuts)))
+    return ir_apply(A_batch, free, kern)
+
 
 # ===== main =====
 if __name__ == "__main__":
@@ -51,6 +121,11 @@ if __name__ == "__main__":
         ("NoCtoD",    False, False, True,  F_DO_NOC2D),
         ("None",      True,  True,  True,  F_DO_NONE),
     ]
-    for name, cutA, cutB, cutC, outp in tqdm(jobs, desc="ablations", ncols=80):
-        simulate_with_A(A_series, cutA, cutB, cutC).to_csv(outp, index=False)
+    V = simulate_with_A_tags(A_series.to_numpy(), [j[1:4] for j in jobs])[:, 0]
+    J, T1, _ = V.shape
+    df_all = pd.DataFrame({"run_tag": np.repeat([j[0] for j in jobs], T1), T_COL: np.tile(np.arange(T1), J),
+                           B_CF: V[..., 0].ravel(), C_CF: V[..., 1].ravel(), D_CF: V[..., 2].ravel(), E_CF: V[..., 3].ravel()})
+    df_all.to_csv(F_DO_ALL, index=False)
+    for name, *_, outp in tqdm(jobs, desc="ablations", ncols=80):
+        df_all[df_all["run_tag"] == name].drop(columns="run_tag").to_csv(outp, index=False)
     print("[53] counterfactuals exported:", [x[4].name for x in jobs])
@@ -1,8 +1,15 @@
-import os, time, yaml
+import os, time, yaml, hashlib
 import numpy as np
 import pandas as pd
 
 PARAMS_YAML = "62_00_params.yaml"
+# rising edges of the A..D flags, read (never written) by 62_03 and 63_02
+ONSET_INDEX = os.path.join("outputs/62_run", "62_onsets.npz")
+
+# forward-mode d(X_hat)/d(baseline, kappa), aggregated per lag by 63_02
+WRITE_SENS = False     # True also writes 62_observed_sens.csv
+SENS_KEYS = ["B0", "C0", "D0", "E0",
+             "kA_B", "kB_C", "kA_C", "kC_D", "kB_D", "kA_D", "kD_E", "kC_E", "kB_E", "kA_E"]
 
 def _need(df: pd.DataFrame, cols, where: str):
     miss = [c for c in cols if c not in df.columns]
@@ -13,6 +20,72 @@ def _clip01(x):
 
 def _log(s): print(f"[6202] {s}", flush=True)
 
+def _seg_lag(x, first, fill):
+    """x shifted one row within each stay; rows opening a stay (first) take fill."""
+    out = np.empty_like(x)
+    out[1:] = x[:-1]
+    out[first] = fill
+    return out
+
+def _seg_ar1(u, first, phi, base):
+    """
+    x[i] = u[i] + phi * (x[i-1] - base) within each stay, with x = base before a
+    stay's first row. Solved over the whole cohort as a log-depth affine scan,
+    so the cost grows with log(stay length); phi == 0 returns u unchanged.
+    """
+    if phi == 0.0:
+        return u
+    b = u - base
+    a = np.full(b.shape, phi)
+    a[first] = 0.0
+    d = 1
+    while d < b.size and a[d:].any():
+        b[d:] = b[d:] + a[d:] * b[:-d]
+        a[d:] = a[d:] * a[:-d]
+        d *= 2
+    return base + b
+
+def _src_hash(paths) -> str:
+    h = hashlib.sha1()
+    for p in paths:
+        with open(p, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 24), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+def _src_stat(paths) -> np.ndarray:
+    """(size, mtime_ns) per path: the cheap check tried before _src_hash."""
+    return np.array([(os.stat(p).st_size, os.stat(p).st_mtime_ns) for p in paths], dtype=np.int64).reshape(-1, 2)
+
+def _build_onsets(df: pd.DataFrame, flags, id_col: str, t_col: str) -> dict:
+    """Rising edges of every flag over the (stay, t)-sorted cohort; the previous hour counts as 0 at each stay start."""
+    sid = df[id_col].to_numpy(); valid = df[id_col].notna().to_numpy()
+    first = np.ones(len(df), dtype=bool); first[1:] = sid[1:] != sid[:-1]
+    start = np.flatnonzero(first & valid); stay_of = np.cumsum(first & valid) - 1
+    rows, codes = [], []
+    for k, f in enumerate(flags):
+        x = df[f].to_numpy().astype(np.int8)
+        prev = np.r_[0, x[:-1]]; prev[first] = 0
+        r = np.flatnonzero((x == 1) & (prev == 0) & valid)
+        rows.append(r); codes.append(np.full(r.size, k, dtype=np.int8))
+    rows = np.concatenate(rows)
+    return {"stays": sid[start], "start": start, "stay": stay_of[rows].astype(np.int32), "row": rows,
+            "t0": df[t_col].to_numpy(np.int64)[rows], "flag": np.concatenate(codes),
+            "flags": np.asarray(flags), "n_rows": np.int64(len(df))}
+
+def write_onset_index(df: pd.DataFrame, flags, id_col: str, t_col: str, src):
+    """
+    Onset index of flags for the cohort just written, with the source paths,
+    their (size, mtime) and their sha1 stored alongside. Readers compare "stat"
+    first, rehash "src" only if it moved, and fall back to an in-memory build
+    when neither matches.
+    """
+    src = list(src)
+    idx = _build_onsets(df, flags, id_col, t_col)
+    idx["src"] = np.asarray(src); idx["stat"] = _src_stat(src); idx["key"] = np.asarray(_src_hash(src))
+    tmp = ONSET_INDEX + ".tmp.npz"
+    np.savez(tmp, **idx); os.replace(tmp, ONSET_INDEX)
+
 def main():
     t0 = time.time()
     with open(PARAMS_YAML, "r", encoding="utf-8") as f:
@@ -38,10 +111,6 @@ def main():
     df = df.sort_values([cols["stay_id"], cols["t"]]).reset_index(drop=True)
 
     B_HAT, C_HAT, D_HAT, E_HAT = "B_hat", "C_hat", "D_hat", "E_hat"
-    df[B_HAT] = np.nan
-    df[C_HAT] = np.nan
-    df[D_HAT] = np.nan
-    df[E_HAT] = np.nan
 
     b0 = float(eff["B"]["baseline"])
     c0 = float(eff["C"]["baseline"])
@@ -62,39 +131,62 @@ def main():
     kB_E = float(eff["E"].get("kappa_B", 0.0))
     kA_E = float(eff["E"].get("kappa_A", 0.0))
 
+    # optional AR(1) persistence around the baseline, as PHI_* in 54_02
+    phB, phC, phD, phE = (float(eff[n].get("phi", 0.0)) for n in ["B", "C", "D", "E"])
+
     ID, T = cols["stay_id"], cols["t"]
     Aflag, Bflag, Cflag, Dflag = cols["A_low_flag"], cols["B_on_flag"], cols["C_low_flag"], cols["D_high_flag"]
 
-    for sid, g in df.groupby(ID, sort=False):
-        idx = g.index.to_numpy()
-        A_prev = g[Aflag].to_numpy(np.float64, copy=False)
-        B_prev = g[Bflag].to_numpy(np.float64, copy=False)
-        C_prev = g[Cflag].to_numpy(np.float64, copy=False)
-        D_prev = g[Dflag].to_numpy(np.float64, copy=False)
-
-        A_lag = np.roll(A_prev, 1); A_lag[0] = 0.0
-        B_lag = np.roll(B_prev, 1); B_lag[0] = 0.0
-        C_lag = np.roll(C_prev, 1); C_lag[0] = 0.0
-        D_lag = np.roll(D_prev, 1); D_lag[0] = 0.0
+    # whole cohort at once: rows are sorted by (stay, t), so within-stay lags are
+    # plain shifts reset at each stay's first row
+    sid = df[ID].to_numpy()
+    first = np.ones(len(df), dtype=bool)
+    first[1:] = sid[1:] != sid[:-1]
+    A_lag = _seg_lag(df[Aflag].to_numpy(np.float64), first, 0.0)
 
-        B_hat = b0 + kA_B * A_lag
+    B_hat = _seg_ar1(b0 + kA_B * A_lag, first, phB, b0)
 
-        B_hat_lag = np.roll(B_hat, 1); B_hat_lag[0] = b0
-        C_hat = c0 + kB_C * B_hat_lag + kA_C * A_lag
+    B_hat_lag = _seg_lag(B_hat, first, b0)
+    C_hat = _seg_ar1(c0 + kB_C * B_hat_lag + kA_C * A_lag, first, phC, c0)
 
-        C_hat_lag = np.roll(C_hat, 1); C_hat_lag[0] = c0
-        D_hat = d0 + kC_D * C_hat_lag + kB_D * B_hat_lag + kA_D * A_lag
+    C_hat_lag = _seg_lag(C_hat, first, c0)
+    D_hat = _seg_ar1(d0 + kC_D * C_hat_lag + kB_D * B_hat_lag + kA_D * A_lag, first, phD, d0)
 
-        D_hat_lag = np.roll(D_hat, 1); D_hat_lag[0] = d0
-        E_hat = e0 + kD_E * D_hat_lag + kC_E * C_hat_lag + kB_E * B_hat_lag + kA_E * A_lag
+    D_hat_lag = _seg_lag(D_hat, first, d0)
+    E_hat = _seg_ar1(e0 + kD_E * D_hat_lag + kC_E * C_hat_lag + kB_E * B_hat_lag + kA_E * A_lag, first, phE, e0)
 
-        df.loc[idx, B_HAT] = B_hat
-        df.loc[idx, C_HAT] = C_hat
-        df.loc[idx, D_HAT] = D_hat
-        df.loc[idx, E_HAT] = _clip01(E_hat)
+    valid = df[ID].notna().to_numpy()                  # groupby() drops rows without a stay id
+    df[B_HAT] = np.where(valid, B_hat, np.nan)
+    df[C_HAT] = np.where(valid, C_hat, np.nan)
+    df[D_HAT] = np.where(valid, D_hat, np.nan)
+    df[E_HAT] = np.where(valid, _clip01(E_hat), np.nan)
 
     df.to_csv(out_csv, index=False)
     _log(f"wrote: {out_csv}")
+    write_onset_index(df, [Aflag, Bflag, Cflag, Dflag], ID, T, [in_csv, out_csv])
+    _log(f"wrote: {ONSET_INDEX}")
+
+    if WRITE_SENS:
+        # the hats are linear in every baseline and kappa given the lower nodes, so each
+        # tangent is the same filter chain driven by the partial derivatives
+        sens_csv = os.path.join(os.path.dirname(out_csv), "62_observed_sens.csv")
+        inside_E = (E_hat > 0.0) & (E_hat < 1.0)      # _clip01 has zero slope outside
+        sens = {ID: df[ID], T: df[T]}
+        for key in SENS_KEYS:
+            e = lambda q: 1.0 if q == key else 0.0
+            dB = _seg_ar1(e("B0") + e("kA_B") * A_lag, first, phB, e("B0"))
+            dB_lag = _seg_lag(dB, first, e("B0"))
+            dC = _seg_ar1(e("C0") + e("kB_C") * B_hat_lag + kB_C * dB_lag + e("kA_C") * A_lag, first, phC, e("C0"))
+            dC_lag = _seg_lag(dC, first, e("C0"))
+            dD = _seg_ar1(e("D0") + e("kC_D") * C_hat_lag + kC_D * dC_lag + e("kB_D") * B_hat_lag + kB_D * dB_lag
+                          + e("kA_D") * A_lag, first, phD, e("D0"))
+            dD_lag = _seg_lag(dD, first, e("D0"))
+            dE = _seg_ar1(e("E0") + e("kD_E") * D_hat_lag + kD_E * dD_lag + e("kC_E") * C_hat_lag + kC_E * dC_lag
+                          + e("kB_E") * B_hat_lag + kB_E * dB_lag + e("kA_E") * A_lag, first, phE, e("E0"))
+            for node, d in zip(["B", "C", "D", "E"], [dB, dC, dD, np.where(inside_E, dE, 0.0)]):
+                sens[f"d{node}_hat__{key}"] = np.where(valid, d, np.nan)
+        pd.DataFrame(sens).to_csv(sens_csv, index=False)
+        _log(f"wrote: {sens_csv}")
     _log(f"done, elapsed={time.time()-t0:.1f}s")
 
 if __name__ == "__main__":
@@ -1,5 +1,5 @@
 
-import os, time
+import os, time, hashlib
 import numpy as np
 import pandas as pd
 
@@ -10,6 +10,9 @@ OUT_AB  = os.path.join(OUT_DIR, "6202_pair_A_to_B.csv")
 OUT_BC  = os.path.join(OUT_DIR, "6202_pair_B_to_C.csv")
 OUT_CD  = os.path.join(OUT_DIR, "6202_pair_C_to_D.csv")
 OUT_DE  = os.path.join(OUT_DIR, "6202_pair_D_to_E_cum.csv")
+# onset index written by 62_02; validated here by (size, mtime), then sha1, of its sources
+ONSET_INDEX = os.path.join(OUT_DIR, "62_onsets.npz")
+LOG_TAG = "[6202-B]"
 
 # ===== params =====
 ID_COL = "stay_id"
@@ -21,62 +24,191 @@ D_HIGH = "D_high"
 E_ON   = "E_on"   
 LAG_PRE  = -12
 LAG_POST = 24
+ALIGN_CHUNK = 1 << 16   # onsets per streamed chunk
 BOOT_N   = 500
+BOOT_UNIT    = "obs"           # "obs": resample each lag's samples (seed+lag); "stay": resample stays, all lags jointly
+BOOT_SCHEME  = "multinomial"   # or "poisson": iid Poisson(1) weights per unit
+BOOT_CHUNK   = 100             # replicates per weight block
+BOOT_WORKERS = 4               # chains aligned in parallel; 1 = serial
 SEED0    = 13
 PROG_STEP = 10
+ONSET_FLAGS = [A_LOW, B_ON, C_LOW, D_HIGH]
+_ONSET_IDX = None
 
 # ===== helpers =====
 def _need_cols(df, need):
     miss = [c for c in need if c not in df.columns]
     if miss: raise KeyError(f"missing columns: {miss}")
 
-def _rising_edges(flag: np.ndarray) -> np.ndarray:
-    x = flag.astype(np.int8)
-    prev = np.r_[0, x[:-1]]
-    return (x == 1) & (prev == 0)
+# ----- onset index reader: _src_hash, _src_stat and _load_onset_index are kept line-for-line
+# across 62_03 fig6B, 62_03 fig6C and 63_02 (scripts are standalone); 62_02 writes the index -----
+def _src_hash(paths) -> str:
+    h = hashlib.sha1()
+    for p in paths:
+        with open(p, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 24), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+def _src_stat(paths) -> np.ndarray:
+    """(size, mtime_ns) per path: the cheap check tried before _src_hash."""
+    return np.array([(os.stat(p).st_size, os.stat(p).st_mtime_ns) for p in paths], dtype=np.int64).reshape(-1, 2)
+
+def _build_onsets(df: pd.DataFrame, flags) -> dict:
+    """Rising edges of every flag over the (stay, t)-sorted cohort; the previous hour counts as 0 at each stay start."""
+    sid = df[ID_COL].to_numpy(); valid = df[ID_COL].notna().to_numpy()
+    first = np.ones(len(df), dtype=bool); first[1:] = sid[1:] != sid[:-1]
+    start = np.flatnonzero(first & valid); stay_of = np.cumsum(first & valid) - 1
+    rows, codes = [], []
+    for k, f in enumerate(flags):
+        x = df[f].to_numpy().astype(np.int8)
+        prev = np.r_[0, x[:-1]]; prev[first] = 0
+        r = np.flatnonzero((x == 1) & (prev == 0) & valid)
+        rows.append(r); codes.append(np.full(r.size, k, dtype=np.int8))
+    rows = np.concatenate(rows)
+    return {"stays": sid[start], "start": start, "stay": stay_of[rows].astype(np.int32), "row": rows,
+            "t0": df[T_COL].to_numpy(np.int64)[rows], "flag": np.concatenate(codes),
+            "flags": np.asarray(flags), "n_rows": np.int64(len(df))}
+
+def _load_onset_index(df: pd.DataFrame) -> dict:
+    """
+    Onset index of ONSET_FLAGS for the (stay, t)-sorted cohort df, as written
+    by 62_02. Its source files are checked by (size, mtime) first and by sha1
+    only if those moved; if neither matches, the onsets are built in memory
+    and nothing is written.
+    """
+    global _ONSET_IDX
+    if _ONSET_IDX is not None: return _ONSET_IDX
+    idx = None
+    if os.path.isfile(ONSET_INDEX):
+        with np.load(ONSET_INDEX, allow_pickle=False) as z:
+            idx = {k: z[k] for k in z.files}
+        src = [str(p) for p in idx.get("src", [])]
+        ok = (src and list(idx["flags"]) == ONSET_FLAGS and int(idx["n_rows"]) == len(df)
+              and all(os.path.isfile(p) for p in src))
+        if not (ok and (("stat" in idx and np.array_equal(idx["stat"], _src_stat(src)))
+                        or str(idx["key"]) == _src_hash(src))):
+            idx = None
+    if idx is None:
+        print(f"{LOG_TAG} {ONSET_INDEX} missing or stale (rerun 62_02); building onsets in memory", flush=True)
+        idx = _build_onsets(df, ONSET_FLAGS)
+    _ONSET_IDX = idx
+    return idx
 
 def _extract_onsets(df: pd.DataFrame, col: str) -> pd.DataFrame:
-    out = []
-    for sid, g in df.groupby(ID_COL, sort=False):
-        idx = np.flatnonzero(_rising_edges(g[col].to_numpy()))
-        if idx.size:
-            out.append(pd.DataFrame({ID_COL: sid, "t0": g.iloc[idx][T_COL].to_numpy(dtype=np.int64)}))
-    return pd.concat(out, ignore_index=True) if out else pd.DataFrame(columns=[ID_COL,"t0"])
-
-def _align_rate(df: pd.DataFrame, trig: pd.DataFrame, resp_col: str,
+    idx = _load_onset_index(df) if col in ONSET_FLAGS else _build_onsets(df, [col])
+    sel = idx["flag"] == list(idx["flags"]).index(col)
+    if not sel.any(): return pd.DataFrame(columns=[ID_COL,"t0"])
+    return pd.DataFrame({ID_COL: idx["stays"][idx["stay"][sel]], "t0": idx["t0"][sel]})
+
+# _row_key/_event_rows/_event_order/_take: same code as the copy in 63_02 (scripts are
+# standalone), in this file's spacing; change both together
+def _row_key(df: pd.DataFrame):
+    """Packed (stay rank, hour) key of every row of df sorted by (stay, t), for _event_rows lookups."""
+    sid = df[ID_COL].to_numpy(); t = df[T_COL].to_numpy(np.int64)
+    if sid.size == 0: return None
+    uniq, rank = np.unique(sid, return_inverse=True)
+    tmin = int(t.min()); span = int(t.max()) - tmin + 1
+    return uniq, rank.astype(np.int64) * span + (t - tmin), tmin, span
+
+def _event_rows(df: pd.DataFrame, trig: pd.DataFrame, lags, rk=None) -> np.ndarray:
+    """(n_events, n_lags) row of (stay, t0+lag) in df sorted by (stay, t); -1 where that hour is absent."""
+    rk = _row_key(df) if rk is None else rk
+    if rk is None: return np.full((len(trig), len(lags)), -1, dtype=np.int64)
+    uniq, key, tmin, span = rk
+    ev_sid = trig[ID_COL].to_numpy(); t0 = trig["t0"].to_numpy(np.int64)
+    er = np.clip(np.searchsorted(uniq, ev_sid), 0, uniq.size - 1); known = uniq[er] == ev_sid
+    off = t0[:, None] + np.asarray(lags, dtype=np.int64)[None, :] - tmin
+    q = er[:, None].astype(np.int64) * span + off
+    pos = np.clip(np.searchsorted(key, q), 0, key.size - 1)
+    hit = known[:, None] & (off >= 0) & (off < span) & (key[pos] == q)
+    return np.where(hit, pos, -1)
+
+def _event_order(trig: pd.DataFrame) -> np.ndarray:
+    """Event positions in trig.groupby(ID_COL, sort=False) order, the order the per-stay loops visited them."""
+    codes, _ = pd.factorize(trig[ID_COL])
+    order = np.argsort(codes, kind="stable")
+    return order[codes[order] >= 0]
+
+def _take(v: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    """v[..., idx] with NaN where idx is -1; v may carry leading (tag, column) axes."""
+    if v.shape[-1] == 0: return np.full(v.shape[:-1] + idx.shape, np.nan)
+    return np.where(idx >= 0, v[..., np.maximum(idx, 0)], np.nan)
+
+def _boot_weights(rng, n: int, size: int, scheme: str) -> np.ndarray:
+    """(size, n) resampling weights: multinomial counts of n draws with replacement, or iid Poisson(1)."""
+    if scheme == "poisson":
+        return rng.poisson(1.0, (size, n)).astype(np.float64)
+    if scheme != "multinomial": raise ValueError(f"unknown BOOT_SCHEME: {scheme}")
+    idx = rng.integers(0, n, (size, n)) + np.arange(size)[:, None] * n
+    return np.bincount(idx.ravel(), minlength=size * n).reshape(size, n).astype(np.float64)
+
+def _boot_means(rng, S: np.ndarray, C: np.ndarray, boot_n: int, scheme: str) -> np.ndarray:
+    """
+    (boot_n, k) replicate means sum(w*S)/sum(w*C) for units carrying sums S
+    (n, k) and counts C (n, k); one weight block per BOOT_CHUNK replicates.
+    Multinomial draws consume the stream exactly like boot_n separate
+    rng.integers(0, n, n) calls.
+    """
+    out = np.empty((boot_n, S.shape[1]))
+    for a in range(0, boot_n, BOOT_CHUNK):
+        W = _boot_weights(rng, S.shape[0], min(BOOT_CHUNK, boot_n - a), scheme)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[a:a + W.shape[0]] = (W @ S) / (W @ C)
+    return out
+
+def _align_rate(v: np.ndarray, rk, trig: pd.DataFrame,
                 lag_pre: int, lag_post: int, boot_n: int, seed: int) -> pd.DataFrame:
+    """
+    Per-lag mean, bootstrap band and count of the response column v (rows of
+    the (stay, t)-sorted cohort, row key rk from _row_key) around the onsets in
+    trig. Workers get only these arrays, not the cohort frame. Onsets stream through the gather ALIGN_CHUNK at a time into
+    mergeable per-lag count/sum accumulators (one chunk reproduces
+    arr.mean() exactly). Only the bootstrap keeps more: the per-lag samples
+    for BOOT_UNIT "obs", per-stay sums/counts for "stay".
+    """
+    if BOOT_UNIT not in ("obs", "stay"):
+        raise ValueError(f"unknown BOOT_UNIT: {BOOT_UNIT}")
     lags = np.arange(lag_pre, lag_post + 1, dtype=int)
     rows = []
-    by_sid = {sid: g.set_index(T_COL)[resp_col].to_numpy() for sid, g in df.groupby(ID_COL, sort=False)}
-    t_by  = {sid: g[T_COL].to_numpy(dtype=np.int64) for sid, g in df.groupby(ID_COL, sort=False)}
-    pos = {sid: {int(t): i for i, t in enumerate(ts)} for sid, ts in t_by.items()}
-    tmin = {sid: ts.min() for sid, ts in t_by.items()}
-    tmax = {sid: ts.max() for sid, ts in t_by.items()}
+    order = _event_order(trig); ev = trig.iloc[order]
+    cnt = np.zeros(lags.size, dtype=np.int64); tot = np.zeros(lags.size)
+    keep = boot_n > 0 and BOOT_UNIT == "obs"
+    samples = [[] for _ in lags]
+    if boot_n > 0 and BOOT_UNIT == "stay":
+        codes, uniq = pd.factorize(trig[ID_COL].to_numpy()[order])
+        S = np.zeros((len(uniq), lags.size)); C = np.zeros((len(uniq), lags.size))
     t0 = time.time()
+    for a in range(0, len(ev), ALIGN_CHUNK):
+        V = _take(v, _event_rows(None, ev.iloc[a:a + ALIGN_CHUNK], lags, rk))
+        ok = ~np.isnan(V)          # absent hours are NaN too; inf is kept as before
+        for j in range(lags.size):
+            x = V[ok[:, j], j]
+            cnt[j] += x.size; tot[j] += np.sum(x)
+            if keep: samples[j].append(x)
+        if boot_n > 0 and BOOT_UNIT == "stay":
+            c = codes[a:a + ALIGN_CHUNK]
+            np.add.at(S, c, np.where(ok, V, 0.0)); np.add.at(C, c, ok)
+    if boot_n > 0 and BOOT_UNIT == "stay":
+        # cluster bootstrap: one weight matrix over stays for every lag
+        reps = _boot_means(np.random.default_rng(seed), S, C, boot_n, BOOT_SCHEME)
+        q_lo, q_hi = np.nanquantile(reps, [0.025, 0.975], axis=0)
     for i, L in enumerate(lags, 1):
-        vals, n_all = [], 0
-        for sid, g in trig.groupby(ID_COL, sort=False):
-            if sid not in by_sid: continue
-            y = by_sid[sid]; idx = pos[sid]
-            for t in g["t0"].to_numpy(np.int64):
-                tt = int(t + L)
-                if tt < tmin[sid] or tt > tmax[sid]: continue
-                j = idx.get(tt, None)
-                if j is None: continue
-                v = y[j]
-                if not np.isnan(v):
-                    vals.append(float(v)); n_all += 1
-        if len(vals) == 0:
+        n_all = int(cnt[i - 1])
+        if n_all == 0:
             rows.append((int(L), np.nan, np.nan, np.nan, 0))
         else:
-            arr = np.asarray(vals, np.float64)
-            rng = np.random.default_rng(seed + int(L))
-            if boot_n > 0:
-                bs = [arr[rng.integers(0, arr.size, arr.size)].mean() for _ in range(boot_n)]
-                lo, hi = np.quantile(bs, [0.025, 0.975]); mean = float(arr.mean())
+            mean = float(tot[i - 1] / n_all)
+            if boot_n > 0 and BOOT_UNIT == "stay":
+                lo, hi = q_lo[i - 1], q_hi[i - 1]
+            elif boot_n > 0:
+                arr = np.concatenate(samples[i - 1])
+                rng = np.random.default_rng(seed + int(L))
+                bs = _boot_means(rng, arr[:, None], np.ones((n_all, 1)), boot_n, BOOT_SCHEME)[:, 0]
+                lo, hi = np.nanquantile(bs, [0.025, 0.975])
             else:
-                mean, lo, hi = float(arr.mean()), np.nan, np.nan
-            rows.append((int(L), mean, float(lo), float(hi), int(n_all)))
+                lo, hi = np.nan, np.nan
+            rows.append((int(L), mean, float(lo), float(hi), n_all))
         if (i % PROG_STEP == 0) or (i == len(lags)):
             print(f"[6202-B] align {i}/{len(lags)}  elapsed={time.time()-t0:.1f}s", flush=True)
     return pd.DataFrame(rows, columns=["lag","mean","lo","hi","n"])
@@ -99,10 +231,21 @@ def main():
     trig_C = _extract_onsets(df, C_LOW)
     trig_D = _extract_onsets(df, D_HIGH)
 
-    ab = _align_rate(df.rename(columns={B_ON:"resp"}), trig_A, "resp", LAG_PRE, LAG_POST, BOOT_N, SEED0+1); ab.to_csv(OUT_AB, index=False)
-    bc = _align_rate(df.rename(columns={C_LOW:"resp"}), trig_B, "resp", LAG_PRE, LAG_POST, BOOT_N, SEED0+2); bc.to_csv(OUT_BC, index=False)
-    cd = _align_rate(df.rename(columns={D_HIGH:"resp"}), trig_C, "resp", LAG_PRE, LAG_POST, BOOT_N, SEED0+3); cd.to_csv(OUT_CD, index=False)
-    de = _align_rate(df.rename(columns={E_ON:"resp"}),   trig_D, "resp", LAG_PRE, LAG_POST, BOOT_N, SEED0+4)
+    # each chain seeds its own generators, so results do not depend on BOOT_WORKERS;
+    # a chain ships one response column and the shared row key, not the frame
+    rk = _row_key(df)
+    col = lambda c: df[c].to_numpy(np.float64)
+    args = [(col(B_ON),   rk, trig_A, LAG_PRE, LAG_POST, BOOT_N, SEED0+1),
+            (col(C_LOW),  rk, trig_B, LAG_PRE, LAG_POST, BOOT_N, SEED0+2),
+            (col(D_HIGH), rk, trig_C, LAG_PRE, LAG_POST, BOOT_N, SEED0+3),
+            (col(E_ON),   rk, trig_D, LAG_PRE, LAG_POST, BOOT_N, SEED0+4)]
+    if BOOT_WORKERS > 1:
+        import multiprocessing as mp
+        with mp.get_context("spawn").Pool(processes=min(BOOT_WORKERS, len(args))) as pool:
+            ab, bc, cd, de = pool.starmap(_align_rate, args)
+    else:
+        ab, bc, cd, de = [_align_rate(*a) for a in args]
+    ab.to_csv(OUT_AB, index=False); bc.to_csv(OUT_BC, index=False); cd.to_csv(OUT_CD, index=False)
     _to_cumulative(de).to_csv(OUT_DE, index=False)
 
     print(f"[6202-B] done -> {OUT_DIR}", flush=True)
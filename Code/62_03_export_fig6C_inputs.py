@@ -1,5 +1,5 @@
 
-import os, time
+import os, time, hashlib, warnings
 import numpy as np
 import pandas as pd
 
@@ -10,6 +10,9 @@ OUT_AB  = os.path.join(OUT_DIR, "6203_chain_AB.csv")
 OUT_BC  = os.path.join(OUT_DIR, "6203_chain_BC.csv")
 OUT_CD  = os.path.join(OUT_DIR, "6203_chain_CD.csv")
 OUT_DE  = os.path.join(OUT_DIR, "6203_chain_DE.csv")
+# onset index written by 62_02; validated here by (size, mtime), then sha1, of its sources
+ONSET_INDEX = os.path.join(OUT_DIR, "62_onsets.npz")
+LOG_TAG = "[6203-C]"
 
 # ===== params =====
 ID_COL = "stay_id"
@@ -18,120 +21,209 @@ A_LOW, B_ON, C_LOW, D_HIGH, E_ON = "A_low", "B_on", "C_low", "D_high", "E_on"
 
 
 LAG_PRE, LAG_POST = -12, 24
-USE_BLOCK_SHUFFLE = True
+USE_BLOCK_SHUFFLE = True     # False: permute onsets over the whole stay
 BLOCK_HOURS = 12
+N_SHUFFLE = 1000             # null replicates; mean_shf is their mean, as in 72_01
+NULL_CHUNK = 2_000_000       # candidate rows x replicates per batch
 SEED0 = 7
+ONSET_FLAGS = [A_LOW, B_ON, C_LOW, D_HIGH]
+_ONSET_IDX = None
 
-def _log(msg): print(f"[6203-C] {msg}", flush=True)
+def _log(msg): print(f"{LOG_TAG} {msg}", flush=True)
 
 def _need_cols(df, cols):
     miss = [c for c in cols if c not in df.columns]
     if miss: raise KeyError(f"missing columns: {miss}")
 
-def _onset_vec(x: np.ndarray) -> np.ndarray:
-
-    x = x.astype(np.int8, copy=False)
-    prev = np.r_[0, x[:-1]]
-    return ((x == 1) & (prev == 0)).astype(np.int8)
+# ----- onset index reader: _src_hash, _src_stat and _load_onset_index are kept line-for-line
+# across 62_03 fig6B, 62_03 fig6C and 63_02 (scripts are standalone); 62_02 writes the index -----
+def _src_hash(paths) -> str:
+    h = hashlib.sha1()
+    for p in paths:
+        with open(p, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 24), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+def _src_stat(paths) -> np.ndarray:
+    """(size, mtime_ns) per path: the cheap check tried before _src_hash."""
+    return np.array([(os.stat(p).st_size, os.stat(p).st_mtime_ns) for p in paths], dtype=np.int64).reshape(-1, 2)
+
+def _build_onsets(df: pd.DataFrame, flags) -> dict:
+    """Rising edges of every flag over the (stay, t)-sorted cohort; the previous hour counts as 0 at each stay start."""
+    sid = df[ID_COL].to_numpy(); valid = df[ID_COL].notna().to_numpy()
+    first = np.ones(len(df), dtype=bool); first[1:] = sid[1:] != sid[:-1]
+    start = np.flatnonzero(first & valid); stay_of = np.cumsum(first & valid) - 1
+    rows, codes = [], []
+    for k, f in enumerate(flags):
+        x = df[f].to_numpy().astype(np.int8)
+        prev = np.r_[0, x[:-1]]; prev[first] = 0
+        r = np.flatnonzero((x == 1) & (prev == 0) & valid)
+        rows.append(r); codes.append(np.full(r.size, k, dtype=np.int8))
+    rows = np.concatenate(rows)
+    return {"stays": sid[start], "start": start, "stay": stay_of[rows].astype(np.int32), "row": rows,
+            "t0": df[T_COL].to_numpy(np.int64)[rows], "flag": np.concatenate(codes),
+            "flags": np.asarray(flags), "n_rows": np.int64(len(df))}
+
+def _load_onset_index(df: pd.DataFrame) -> dict:
+    """
+    Onset index of ONSET_FLAGS for the (stay, t)-sorted cohort df, as written
+    by 62_02. Its source files are checked by (size, mtime) first and by sha1
+    only if those moved; if neither matches, the onsets are built in memory
+    and nothing is written.
+    """
+    global _ONSET_IDX
+    if _ONSET_IDX is not None: return _ONSET_IDX
+    idx = None
+    if os.path.isfile(ONSET_INDEX):
+        with np.load(ONSET_INDEX, allow_pickle=False) as z:
+            idx = {k: z[k] for k in z.files}
+        src = [str(p) for p in idx.get("src", [])]
+        ok = (src and list(idx["flags"]) == ONSET_FLAGS and int(idx["n_rows"]) == len(df)
+              and all(os.path.isfile(p) for p in src))
+        if not (ok and (("stat" in idx and np.array_equal(idx["stat"], _src_stat(src)))
+                        or str(idx["key"]) == _src_hash(src))):
+            idx = None
+    if idx is None:
+        print(f"{LOG_TAG} {ONSET_INDEX} missing or stale (rerun 62_02); building onsets in memory", flush=True)
+        idx = _build_onsets(df, ONSET_FLAGS)
+    _ONSET_IDX = idx
+    return idx
+
+def _onset_col(df: pd.DataFrame, col: str) -> np.ndarray:
+    """int8 onset indicator per row of df, per-stay rising edges of col."""
+    idx = _load_onset_index(df) if col in ONSET_FLAGS else _build_onsets(df, [col])
+    O = np.zeros(len(df), dtype=np.int8)
+    O[idx["row"][idx["flag"] == list(idx["flags"]).index(col)]] = 1
+    return O
 
 def _block_id(ts: np.ndarray, block_hours: int) -> np.ndarray:
     return (ts.astype(np.int64) // int(block_hours)).astype(np.int64)
 
+def _stay_layout(df: pd.DataFrame):
+    """Per row of the (stay, t)-sorted cohort: stay-start flag, stay index, position in the stay, and stay lengths."""
+    n = len(df)
+    sid = df[ID_COL].to_numpy()
+    first = np.ones(n, dtype=bool); first[1:] = sid[1:] != sid[:-1]
+    stay = np.cumsum(first) - 1
+    start = np.flatnonzero(first); length = np.diff(np.r_[start, n])
+    return first, stay, np.arange(n) - start[stay], length
+
+def _lagged_rows(rows: np.ndarray, Y: np.ndarray, valid: np.ndarray, lags: np.ndarray,
+                 stay: np.ndarray, pos: np.ndarray, length: np.ndarray):
+    """
+    (len(rows), n_lags) response Y[row+lag] with NaN -> 0 and its validity,
+    where row+lag must stay inside the row's stay, i.e. the shift
+    _aggregate_mean_over_lags applies within one stay.
+    """
+    sh = pos[rows][:, None] + lags[None, :]
+    inside = (sh >= 0) & (sh < length[stay[rows]][:, None])
+    tgt = np.clip(rows[:, None] + lags[None, :], 0, max(len(Y) - 1, 0))
+    V = inside & valid[tgt]
+    return np.where(V, np.nan_to_num(Y[tgt]), 0.0), V.astype(np.float64)
+
 def _aggregate_mean_over_lags(O: np.ndarray, Y: np.ndarray, valid: np.ndarray,
-                              lag_pre: int, lag_post: int) -> tuple[np.ndarray, np.ndarray]:
+                              lag_pre: int, lag_post: int, layout=None) -> tuple[np.ndarray, np.ndarray]:
     """
     返回 (num[lag_idx], den[lag_idx])，lag_idx 对应 range(lag_pre, lag_post+1)
     num = sum O[t] * Y[t+lag] (只在 valid[t+lag]=True 计入)
     den = sum O[t] *        1 (只在 valid[t+lag]=True 计入)
+    All lags in one gather over the onset rows; with layout=_stay_layout(df)
+    the arrays are the whole concatenated cohort and t+lag never crosses a
+    stay boundary, otherwise they are a single stay.
     """
+    lags = np.arange(lag_pre, lag_post+1, dtype=np.int64)
     n = O.shape[0]
-    lags = np.arange(lag_pre, lag_post+1, dtype=np.int32)
-    num = np.zeros_like(lags, dtype=np.float64)
-    den = np.zeros_like(lags, dtype=np.float64)
-
-    O_f = O.astype(np.float64, copy=False)
-    V_f = valid.astype(np.float64, copy=False)
-    for i, L in enumerate(lags):
-        if L == 0:
-            y = Y
-            v = V_f
-            o = O_f
-        elif L > 0:
-            if n - L <= 0: continue
-            y = Y[L:]
-            v = V_f[L:]
-            o = O_f[:-L]
-        else:  # L < 0
-            k = -L
-            if n - k <= 0: continue
-            y = Y[:-k]
-            v = V_f[:-k]
-            o = O_f[k:]
-
-        if y.size == 0: 
-            continue
-
-        y_ = np.nan_to_num(y, copy=False)
-        w  = o * v
-        num[i] += float((w * y_).sum())
-        den[i] += float(w.sum())
-    return num, den
+    if layout is None:
+        layout = (None, np.zeros(n, dtype=np.int64), np.arange(n), np.array([n]))
+    _, stay, pos, length = layout
+    rows = np.flatnonzero(O)
+    if rows.size == 0:
+        return np.zeros(lags.size), np.zeros(lags.size)
+    w = O[rows].astype(np.float64)
+    Yv, Vf = _lagged_rows(rows, Y, valid, lags, stay, pos, length)
+    return w @ Yv, w @ Vf
+
+def _null_replicates(df: pd.DataFrame, O_all: np.ndarray, vy: str,
+                     block_hours: int, n_rep: int, seed: int) -> np.ndarray:
+    """
+    (n_rep, n_lags) onset-aligned means of vy with the onsets permuted inside
+    their (stay, block) cells, every stay at once. Only rows of cells that hold
+    onsets can receive one; a replicate gives each row an iid uniform key and
+    keeps, per cell, the rows whose key is among the cell's m smallest, i.e. a
+    uniform m-subset like rng.choice(..., replace=False). Cells are contiguous
+    runs of the candidates, so sorting cell + key ranks every row within its
+    cell without padding: memory is replicates x candidates per chunk,
+    bounded by NULL_CHUNK whatever the cell sizes. The per-lag sums are
+    then one matrix product of the (replicate x row) selection with the
+    lagged response of each candidate row (shifted within the stay, as in
+    _aggregate_mean_over_lags).
+    """
+    lags = np.arange(LAG_PRE, LAG_POST+1, dtype=np.int64)
+    n = len(df)
+    if n == 0 or n_rep <= 0:
+        return np.full((max(n_rep, 0), lags.size), np.nan)
+    first, stay, pos, length = _stay_layout(df)
+    bid = _block_id(df[T_COL].to_numpy(), block_hours) if USE_BLOCK_SHUFFLE else np.zeros(n, dtype=np.int64)
+    newb = first.copy(); newb[1:] |= bid[1:] != bid[:-1]
+    cell = np.cumsum(newb) - 1
+    m = np.bincount(cell, weights=O_all, minlength=cell[-1]+1).astype(np.int64)
+    cand = np.flatnonzero(m[cell] > 0)
+    if cand.size == 0:
+        return np.full((n_rep, lags.size), np.nan)
+
+    y = df[vy].to_numpy(dtype=float)
+    Yv, Vf = _lagged_rows(cand, y, ~np.isnan(y), lags, stay, pos, length)
+
+    # cell index and slot of each candidate; sorted by (cell, key), the first m
+    # slots of every cell hold its m smallest keys, the same positions each replicate
+    ci = np.cumsum(np.r_[True, cell[cand][1:] != cell[cand][:-1]]) - 1
+    slot = np.arange(cand.size) - np.flatnonzero(np.r_[True, ci[1:] != ci[:-1]])[ci]
+    keep = np.flatnonzero(slot < m[cell[cand]])
+
+    rng = np.random.default_rng(seed)
+    out = np.empty((n_rep, lags.size))
+    step = max(1, NULL_CHUNK // cand.size)
+    for a in range(0, n_rep, step):
+        c = min(step, n_rep - a)
+        u = rng.random((c, cand.size))
+        order = np.argsort(ci + u, axis=1)      # rounding is monotone: order within a cell is kept
+        S = np.zeros((c, cand.size))
+        np.put_along_axis(S, order[:, keep], 1.0, axis=1)
+        num = S @ Yv; den = S @ Vf
+        out[a:a+c] = np.divide(num, den, out=np.full_like(num, np.nan), where=den > 0)
+    return out
 
 def _compute_curve(df: pd.DataFrame, vx: str, vy: str,
                    block_hours: int, seed: int) -> pd.DataFrame:
     lags = np.arange(LAG_PRE, LAG_POST+1, dtype=np.int32)
 
-    num_ord = np.zeros_like(lags, dtype=np.float64)
-    den_ord = np.zeros_like(lags, dtype=np.float64)
-
-    num_shf = np.zeros_like(lags, dtype=np.float64)
-    den_shf = np.zeros_like(lags, dtype=np.float64)
-
-    rng = np.random.default_rng(seed)
-
-    for sid, g in df.groupby(ID_COL, sort=False):
-        x = g[vx].to_numpy()
-        y = g[vy].to_numpy(dtype=float)
-        ts= g[T_COL].to_numpy(dtype=np.int64)
-
-        O  = _onset_vec(x)                      
-        M  = ~np.isnan(y)                       
-        bid= _block_id(ts, block_hours)      
-
-        # A) ordered 累计
-        n1, d1 = _aggregate_mean_over_lags(O, y, M, LAG_PRE, LAG_POST)
-        num_ord += n1; den_ord += d1
-
-        O_shf = np.zeros_like(O, dtype=np.int8)
-
-        if O.sum() > 0:
-            idx = np.flatnonzero(np.r_[True, np.diff(bid) != 0, True])
-
-            for k in range(len(idx)-1):
-                s, e = int(idx[k]), int(idx[k+1])  # [s, e)
-                m = int(O[s:e].sum())
-                if m <= 0:
-                    continue
-                Lblock = e - s
-                m = min(m, Lblock)
-
-                picks = rng.choice(Lblock, size=m, replace=False)
-                O_shf[s + picks] = 1
+    O_all = _onset_col(df, vx)
+    y = df[vy].to_numpy(dtype=float)
 
-        n2, d2 = _aggregate_mean_over_lags(O_shf, y, M, LAG_PRE, LAG_POST)
-        num_shf += n2; den_shf += d2
+    # A) ordered 累计: every stay and lag in one pass
+    num_ord, den_ord = _aggregate_mean_over_lags(O_all, y, ~np.isnan(y), LAG_PRE, LAG_POST, _stay_layout(df))
 
     mean_ord = np.divide(num_ord, den_ord, out=np.full_like(num_ord, np.nan, dtype=float), where=den_ord>0)
-    mean_shf = np.divide(num_shf, den_shf, out=np.full_like(num_shf, np.nan, dtype=float), where=den_shf>0)
+    reps = _null_replicates(df, O_all, vy, block_hours, N_SHUFFLE, seed)
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)      # all-NaN lags
+        mean_shf = np.nanmean(reps, axis=0)
+        shf_lo, shf_hi = np.nanquantile(reps, [0.025, 0.975], axis=0)
+        # two-sided: null replicates at least as far from the null mean as the ordered curve
+        dev = np.abs(reps - mean_shf); obs = np.abs(mean_ord - mean_shf)
+        n_ok = (~np.isnan(reps)).sum(axis=0)
+        p_perm = np.where(np.isfinite(obs) & (n_ok > 0), (1 + (dev >= obs).sum(axis=0)) / (n_ok + 1), np.nan)
     delta    = mean_ord - mean_shf
 
-    out = pd.DataFrame({"lag": lags, "mean_ord": mean_ord, "mean_shf": mean_shf, "delta": delta})
+    out = pd.DataFrame({"lag": lags, "mean_ord": mean_ord, "mean_shf": mean_shf, "delta": delta,
+                        "shf_lo": shf_lo, "shf_hi": shf_hi, "p_perm": p_perm})
     return out
 
 def _run_chain(df, vx, vy, seed, path, tag):
     t = time.time()
 
-    n_onsets = int((_onset_vec(df[vx].to_numpy())==1).sum())
+    n_onsets = int(_onset_col(df, vx).sum())
     _log(f"{tag}: onsets={n_onsets}")
     curv = _compute_curve(df, vx, vy, BLOCK_HOURS, seed)
     curv.to_csv(path, index=False)
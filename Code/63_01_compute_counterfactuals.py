@@ -1,5 +1,6 @@
 
 import os
+import hashlib
 import yaml
 import numpy as np
 import pandas as pd
@@ -22,10 +23,57 @@ OUT_NOC2E   = os.path.join(OUT63_DIR, "632_do__NoCtoE.csv")
 OUT_NOD2E   = os.path.join(OUT63_DIR, "632_do__NoDtoE.csv")
 OUT_NONE_E  = os.path.join(OUT63_DIR, "632_do__NoneE.csv")
 
+OUT_ONSET_FMT = os.path.join(OUT63_DIR, "633_do_onset__{tag}.csv")
+OUT_ALL     = os.path.join(OUT63_DIR, "631_do__ALL.csv")     # every tag, long format with run_tag
+OUT_MC      = os.path.join(OUT63_DIR, "634_do_mc_bands.csv")  # Monte Carlo mean/sd/quantiles per (tag, t)
+OUT_POLICY  = os.path.join(OUT63_DIR, "635_policy_summary.csv")  # cohort means per (policy, t)
+OUT_SENS_FMT = os.path.join(OUT63_DIR, "631_sens__{tag}.csv")   # d(B..E_hat_doA0)/d(baseline, kappa) per row
+
+TAG_OUTS = {
+    "Full_main": OUT_FULL,
+    "NoAtoB":    OUT_NOA2B,
+    "NoBtoC":    OUT_NOB2C,
+    "NoCtoD":    OUT_NOC2D,
+    "None":      OUT_NONE,
+
+    "NoAtoE":    OUT_NOA2E,
+    "NoBtoE":    OUT_NOB2E,
+    "NoCtoE":    OUT_NOC2E,
+    "NoDtoE":    OUT_NOD2E,
+    "NoneE":     OUT_NONE_E,
+}
+
 # ===== params =====
 REQ_COLS = ["stay_id", "t", "A_low"]   
 PROGRESS_UNIT = "stay"
 
+# onset-branched do(A=0): recursion restarts at each A_low onset t0 from the observed hats at hour t0-1
+ONSET_TAGS = []                     # e.g. ["Full_main"]; [] disables the onset-branched output
+HAT_COLS   = ["B_hat", "C_hat", "D_hat", "E_hat"]
+LAG_PRE = -12; LAG_POST = 24
+
+# forward-mode sensitivities of the do(A=0) paths, aggregated per lag by 63_02
+SENS_TAGS = []                      # e.g. ["Full_main"]; [] disables
+
+# Monte Carlo do(A=0): noise.{B..E}.sigma and runconf.seed from PARAMS_YAML
+MC_DRAWS      = 0                    # draws per stay; 0 disables the MC output
+MC_TAGS       = ["Full_main"]        # tags share the same draws (common random numbers)
+MC_QUANTILES  = [0.05, 0.50, 0.95]
+MC_CHUNK_ROWS = 2048                 # cohort rows simulated together; memory ~ tags*draws*rows*32 bytes
+MC_Q_BINS     = 512                  # fixed-range histogram sketch per (tag, t, node)
+MC_Q_SPAN     = 6.0                  # sketch range: deterministic path +- span * stationary sd
+
+# intervention policies do(A=a(t)): each maps the observed A_low path to an intervened one
+#   observed         A as observed                 static a   A = a throughout
+#   shift d          A_value raised by d mmHg, re-thresholded at thresholds.A_low
+#   cap h            exposure stops after h cumulative hours per stay
+#   delay k          every A_low episode is corrected after its first k hours
+#   stochastic p     each exposed hour is corrected with probability p (runconf.seed)
+# e.g. [("observed", None), ("static", 0.0), ("shift", 10.0), ("cap", 12), ("delay", 2), ("stochastic", 0.5)]
+POLICIES = []                        # [] disables the policy output
+POLICY_TAG        = "Full_main"      # effects the policies are evaluated under
+POLICY_CHUNK_ROWS = 1 << 13          # cohort rows per pass; memory ~ policies*rows*40 bytes
+
 
 RUN_SPECS = {
 
@@ -72,6 +120,20 @@ def load_params(yaml_path: str) -> dict:
                 _err(f"effects.{node} missing key '{k}'")
     return eff
 
+def load_noise(yaml_path: str):
+    """(sigma_B..E array, seed) from the noise and runconf sections."""
+    with open(yaml_path, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    noise = cfg.get("noise") or {}
+    sig = np.array([float((noise.get(n) or {}).get("sigma", 0.0)) for n in ["B", "C", "D", "E"]])
+    return sig, int((cfg.get("runconf") or {}).get("seed", 0))
+
+def load_policy_conf(yaml_path: str):
+    """(A_low threshold, seed) for the shift and stochastic policies."""
+    with open(yaml_path, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    return float(cfg["thresholds"]["A_low"]), int((cfg.get("runconf") or {}).get("seed", 0))
+
 def apply_run_overrides(effects_base: dict, run_tag: str) -> dict:
     eff = {k: dict(v) for k, v in effects_base.items()}
     spec = RUN_SPECS.get(run_tag, {})
@@ -81,7 +143,7 @@ def apply_run_overrides(effects_base: dict, run_tag: str) -> dict:
                 eff[node][k] = 0.0
     return eff
 
-def load_observed(csv_path: str) -> pd.DataFrame:
+def load_observed(csv_path: str, extra_cols=()) -> pd.DataFrame:
     if not os.path.exists(csv_path):
         _err(f"missing input file: {csv_path}")
     need = [
@@ -91,7 +153,7 @@ def load_observed(csv_path: str) -> pd.DataFrame:
         "B_sum_value",      
         "C_value",          
         "D_value"           
-    ]
+    ] + list(extra_cols)
     df_all = pd.read_csv(csv_path)
     miss = [c for c in need if c not in df_all.columns]
     if miss:
@@ -132,6 +194,17 @@ def simulate_doA0_one_stay(stay_df, effects, cut_edges=None, use_local_baseline=
     kB_E = 0.0 if "B->E" in cut_edges else effects.get("kB_E", 0.0)
     kA_E = 0.0 if "A->E" in cut_edges else effects.get("kA_E", 0.0)
 
+    if not use_local_baseline:
+        # the stay enters only through its length: slice the memoized path
+        path = doA0_trajectory(effects, cut_edges, len(sdf))
+        return pd.DataFrame({
+            "t": t_series,
+            "B_do": path[:, 0],
+            "C_do": path[:, 1],
+            "D_do": path[:, 2],
+            "E_do": path[:, 3],
+        })
+
     if use_local_baseline:
         w = max(1, min(baseline_window, len(sdf)))
         B0 = float(sdf["B_sum_value"].iloc[:w].mean())
@@ -149,6 +222,9 @@ def simulate_doA0_one_stay(stay_df, effects, cut_edges=None, use_local_baseline=
     D[0] = D0
     E[0] = E0
 
+    phB, phC, phD, phE = (effects.get(f"phi_{n}", 0.0) for n in ["B", "C", "D", "E"])
+    persist = any([phB, phC, phD, phE])
+
     for i in range(1, len(sdf)):
         A_prev = 0.0
         B_prev, C_prev, D_prev = B[i-1], C[i-1], D[i-1]
@@ -157,6 +233,9 @@ def simulate_doA0_one_stay(stay_df, effects, cut_edges=None, use_local_baseline=
         C[i] = C0 + kB_C * B_prev + kA_C * A_prev
         D[i] = D0 + kC_D * C_prev + kB_D * B_prev + kA_D * A_prev
         E[i] = E0 + kD_E * D_prev + kC_E * C_prev + kB_E * B_prev + kA_E * A_prev
+        if persist:
+            B[i] += phB * (B_prev - B0); C[i] += phC * (C_prev - C0)
+            D[i] += phD * (D_prev - D0); E[i] += phE * (E[i-1] - E0)
 
     out = pd.DataFrame({
         "t": t_series,
@@ -168,31 +247,91 @@ def simulate_doA0_one_stay(stay_df, effects, cut_edges=None, use_local_baseline=
     return out
 
 
+def simulate_doA0_onset_branches(A_low, hats, effects, lag_post=LAG_POST, t=None):
+    """
+    do(A=0) branched at every A_low onset of one stay, all onsets in one batch.
+    A_low: (n,) flags; hats: (n, 4) observed B/C/D/E_hat; t: (n,) sorted hours
+    (0..n-1 when None). The branch for the onset at hour t0 starts from the
+    hats at hour t0-1 (the baselines when t0 is the first hour of the stay,
+    NaN when hour t0-1 is missing mid-stay) and steps the same hourly
+    recursion as simulate_doA0_one_stay. Returns (onset positions,
+    (n_onsets, lag_post+1, 4) array for hours t0+h), NaN past the last hour.
+    """
+    x = np.asarray(A_low).astype(np.int8)
+    prev = np.r_[0, x[:-1]]
+    on = np.flatnonzero((x == 1) & (prev == 0))
+    n = x.size
+    t = np.arange(n) if t is None else np.asarray(t, dtype=np.int64)
+    out = np.full((on.size, lag_post + 1, 4), np.nan)
+    if on.size == 0:
+        return on, out
+
+    B0 = effects["B0"]; C0 = effects["C0"]; D0 = effects["D0"]; E0 = effects["E0"]
+    kA_B = effects["kA_B"]
+    kB_C = effects["kB_C"]; kA_C = effects.get("kA_C", 0.0)
+    kC_D = effects["kC_D"]; kB_D = effects.get("kB_D", 0.0); kA_D = effects.get("kA_D", 0.0)
+    kD_E = effects["kD_E"]; kC_E = effects.get("kC_E", 0.0); kB_E = effects.get("kB_E", 0.0); kA_E = effects.get("kA_E", 0.0)
+    phB, phC, phD, phE = (effects.get(f"phi_{n}", 0.0) for n in ["B", "C", "D", "E"])
+    persist = any([phB, phC, phD, phE])
+
+    t0 = t[on]
+    pp = np.clip(np.searchsorted(t, t0 - 1), 0, n - 1)
+    st = np.where((t[pp] == t0 - 1)[:, None], np.asarray(hats, dtype=np.float64)[pp], np.nan)
+    st[on == 0] = (B0, C0, D0, E0)
+    B, C, D, E = st[:, 0], st[:, 1], st[:, 2], st[:, 3]
+    A_prev = 0.0
+    for h in range(lag_post + 1):
+        Bn, Cn, Dn, En = (np.full_like(B, B0 + kA_B * A_prev),
+                          C0 + kB_C * B + kA_C * A_prev,
+                          D0 + kC_D * C + kB_D * B + kA_D * A_prev,
+                          E0 + kD_E * D + kC_E * C + kB_E * B + kA_E * A_prev)
+        if persist:
+            Bn += phB * (B - B0); Cn += phC * (C - C0); Dn += phD * (D - D0); En += phE * (E - E0)
+        B, C, D, E = Bn, Cn, Dn, En
+        ok = t0 + h <= t[-1]
+        out[ok, h] = np.stack([B, C, D, E], axis=1)[ok]
+    return on, out
+
+def run_onset_tag_and_write(df_obs: pd.DataFrame, run_tag: str, effects_base: dict, out_path: str):
+    eff_flat = flatten_effects(apply_run_overrides(effects_base, run_tag))
+    sid_all = df_obs["stay_id"].to_numpy()
+    t_all = df_obs["t"].to_numpy()
+    A_all = df_obs["A_low"].to_numpy()
+    H_all = df_obs[HAT_COLS].to_numpy(np.float64)
+    starts, ends = stay_offsets(sid_all)
+    lags = np.arange(LAG_PRE, LAG_POST + 1)
+    parts = []
+    for s, e in tqdm(zip(starts, ends), total=starts.size, desc=f" onset {run_tag}", unit=PROGRESS_UNIT):
+        t = t_all[s:e]
+        on, cf = simulate_doA0_onset_branches(A_all[s:e], H_all[s:e], eff_flat, t=t)
+        if on.size == 0:
+            continue
+        # window by hour, as 63_02 does: lag L is hour t0+L, kept only where the stay has that hour
+        hr = t[on][:, None] + lags[None, :]
+        pos = np.clip(np.searchsorted(t, hr), 0, e - s - 1)
+        ok = t[pos] == hr
+        vals = np.full((on.size, lags.size, 4), np.nan)
+        pre = lags < 0
+        vals[:, pre] = H_all[s:e][pos[:, pre]]             # before t0 the branch is the observed path
+        vals[:, ~pre] = cf
+        oi, li = np.nonzero(ok)
+        parts.append(pd.DataFrame({
+            "stay_id": sid_all[s],
+            "t0": t[on[oi]],
+            "lag": lags[li],
+            "t": hr[oi, li],
+            "B_hat_doA0": vals[oi, li, 0],
+            "C_hat_doA0": vals[oi, li, 1],
+            "D_hat_doA0": vals[oi, li, 2],
+            "E_hat_doA0": vals[oi, li, 3],
+        }))
+    cols = ["stay_id", "t0", "lag", "t", "run_tag", "B_hat_doA0", "C_hat_doA0", "D_hat_doA0", "E_hat_doA0"]
+    out = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=[c for c in cols if c != "run_tag"])
+    out.insert(4, "run_tag", run_tag)
+    out[cols].to_csv(out_path, index=False)
+
 def run_tag_and_write(df_obs: pd.DataFrame, run_tag: str, effects_base: dict, out_path: str):
-    eff_nested = apply_run_overrides(effects_base, run_tag)
-    eff_flat = flatten_effects(eff_nested)
-
-    stays = df_obs["stay_id"].unique().tolist()
-    rows = []
-    pbar = tqdm(total=len(stays), desc=f" {run_tag}", unit=PROGRESS_UNIT)
-    for sid in stays:
-        sub = df_obs[df_obs["stay_id"] == sid]
-        sim = simulate_doA0_one_stay(sub, eff_flat)
-        sim = sim.rename(columns={
-            "B_do": "B_hat_doA0",
-            "C_do": "C_hat_doA0",
-            "D_do": "D_hat_doA0",
-            "E_do": "E_hat_doA0",
-        })
-        sim.insert(0, "stay_id", int(sid))
-        sim.insert(1, "run_tag", run_tag)
-        rows.append(sim)
-        pbar.update(1)
-    pbar.close()
-
-    out = pd.concat(rows, ignore_index=True)
-    out = out[["stay_id", "t", "run_tag", "B_hat_doA0", "C_hat_doA0", "D_hat_doA0", "E_hat_doA0"]]
-    out.to_csv(out_path, index=False)
+    run_all_tags_and_write(df_obs, [run_tag], effects_base, out_path)
 
 def flatten_effects(eff_nested: dict) -> dict:
 
@@ -215,26 +354,412 @@ def flatten_effects(eff_nested: dict) -> dict:
     f["kC_E"] = eff_nested["E"].get("kappa_C", 0.0)
     f["kB_E"] = eff_nested["E"].get("kappa_B", 0.0)
     f["kA_E"] = eff_nested["E"].get("kappa_A", 0.0)
+
+    for n in ["B", "C", "D", "E"]:
+        f[f"phi_{n}"] = eff_nested[n].get("phi", 0.0)
     return f
 
+FLAT_KEYS = ["B0", "C0", "D0", "E0",
+             "kA_B", "kB_C", "kA_C", "kC_D", "kB_D", "kA_D", "kD_E", "kC_E", "kB_E", "kA_E",
+             "phi_B", "phi_C", "phi_D", "phi_E"]
+
+SENS_KEYS = FLAT_KEYS[:14]           # baselines and kappas
+
+def spec_mask(run_tags) -> np.ndarray:
+    """(n_tags, len(FLAT_KEYS)) keep-mask: 0 where RUN_SPECS zeroes the kappa for that tag."""
+    m = np.ones((len(run_tags), len(FLAT_KEYS)), dtype=bool)
+    for i, tag in enumerate(run_tags):
+        for node, zero_keys in RUN_SPECS.get(tag, {}).items():
+            for k in zero_keys:
+                m[i, FLAT_KEYS.index(f"k{k[len('kappa_'):]}_{node}")] = False
+    return m
+
+def effects_tensor(effects_base: dict, run_tags) -> np.ndarray:
+    """(n_tags, len(FLAT_KEYS)) effects, one row per tag; same values as apply_run_overrides + flatten_effects."""
+    f = flatten_effects(effects_base)
+    base = np.array([f[k] for k in FLAT_KEYS], dtype=np.float64)
+    return np.where(spec_mask(run_tags), base[None, :], 0.0)
+
+def stay_offsets(sid_all: np.ndarray):
+    """[start, end) row offsets of each stay in a cohort sorted by (stay_id, t)."""
+    starts = np.flatnonzero(np.r_[True, sid_all[1:] != sid_all[:-1]]) if sid_all.size else np.array([], dtype=int)
+    return starts, np.r_[starts[1:], sid_all.size].astype(int)
+
+def simulate_doA0_cohort(starts: np.ndarray, ends: np.ndarray, K: np.ndarray, noise=None, A=None) -> np.ndarray:
+    """
+    simulate_doA0_one_stay for every stay and every row of the effects tensor K
+    at once. Step i advances the rows at offset i of all stays longer than i, so
+    the work is linear in cohort rows. Returns (n_tags, n_rows, 4) B/C/D/E.
+    noise: optional (M, n_rows, 4) shocks added to every non-initial row; the
+    result is then (n_tags, M, n_rows, 4).
+    A: optional (P, n_rows) intervened exposure read as A_prev instead of 0;
+    the result is then (n_tags, P, n_rows, 4). Not combined with noise.
+    """
+    if noise is not None and A is not None:
+        raise ValueError("simulate_doA0_cohort takes noise or A, not both")
+    J = K.shape[0]
+    extra = noise if noise is not None else A
+    lead = (J,) if extra is None else (J, extra.shape[0])
+    c = K.reshape((J,) + (1,) * len(lead) + (K.shape[1],))    # broadcasts against lead + (rows,)
+    (B0, C0, D0, E0, kA_B, kB_C, kA_C, kC_D, kB_D, kA_D, kD_E, kC_E, kB_E, kA_E,
+     phB, phC, phD, phE) = (c[..., j] for j in range(K.shape[1]))
+    persist = bool(np.any(K[:, 14:] != 0))
+    lens = ends - starts
+    order = np.argsort(-lens, kind="stable")
+    s_ord = starts[order]
+    n_act = np.searchsorted(-lens[order], -np.arange(int(lens.max(initial=0))), side="left")  # stays with len > i
+    out = np.empty(lead + (int(ends[-1]) if ends.size else 0, 4))
+    out[..., starts, :] = c[..., :4]
+    A_prev = 0.0
+    for i in range(1, n_act.size):
+        cur = s_ord[:n_act[i]] + i
+        if A is not None:
+            A_prev = A[:, cur - 1]
+        B_prev, C_prev, D_prev = out[..., cur - 1, 0], out[..., cur - 1, 1], out[..., cur - 1, 2]
+        out[..., cur, 0] = B0 + kA_B * A_prev
+        out[..., cur, 1] = C0 + kB_C * B_prev + kA_C * A_prev
+        out[..., cur, 2] = D0 + kC_D * C_prev + kB_D * B_prev + kA_D * A_prev
+        out[..., cur, 3] = E0 + kD_E * D_prev + kC_E * C_prev + kB_E * B_prev + kA_E * A_prev
+        if persist:                                   # AR(1) around the baselines: one more fused term per node
+            out[..., cur, 0] += phB * (B_prev - B0)
+            out[..., cur, 1] += phC * (C_prev - C0)
+            out[..., cur, 2] += phD * (D_prev - D0)
+            out[..., cur, 3] += phE * (out[..., cur - 1, 3] - E0)
+        if noise is not None:
+            out[..., cur, :] += noise[:, cur, :]
+    return out
+
+# do(A=0) paths without a local baseline depend only on (effects, cuts, horizon);
+# each is computed once to the longest horizon asked for and sliced per stay
+_CF_CACHE = {}
+_CF_STATS = {"computed": 0, "lookups": 0}
+
+def effects_key(effects: dict, cut_edges=()) -> tuple:
+    vec = np.array([float(effects.get(k, 0.0)) for k in FLAT_KEYS])
+    return hashlib.sha1(vec.tobytes()).hexdigest(), tuple(sorted(cut_edges))
+
+def _cut_effects(effects: dict, cut_edges=()) -> np.ndarray:
+    cut = {f"k{e[0]}_{e[-1]}" for e in cut_edges}
+    return np.array([0.0 if k in cut else float(effects.get(k, 0.0)) for k in FLAT_KEYS])
+
+def doA0_trajectories(effects_list, horizon: int, cut_edges=()) -> np.ndarray:
+    """
+    (n_effects, horizon, 4) memoized do(A=0) paths. Misses are computed together
+    as one stay of length horizon under every missed effects row (n_tags = misses).
+    """
+    keys = [effects_key(e, cut_edges) for e in effects_list]
+    _CF_STATS["lookups"] += len(keys)
+    miss = [i for i, k in enumerate(keys) if k not in _CF_CACHE or _CF_CACHE[k].shape[0] < horizon]
+    if miss:
+        K = np.stack([_cut_effects(effects_list[i], cut_edges) for i in miss])
+        paths = simulate_doA0_cohort(np.array([0]), np.array([horizon]), K)
+        for j, i in enumerate(miss):
+            _CF_CACHE[keys[i]] = paths[j].copy()
+        _CF_STATS["computed"] += len(miss)
+    return np.stack([_CF_CACHE[k][:horizon] for k in keys]) if keys else np.empty((0, horizon, 4))
+
+def doA0_trajectory(effects: dict, cut_edges, horizon: int) -> np.ndarray:
+    return doA0_trajectories([effects], horizon, cut_edges or ())[0]
+
+def cache_report() -> str:
+    st = _CF_STATS
+    n = st["lookups"]
+    rate = 1.0 - st["computed"] / n if n else float("nan")
+    return (f"[63_01] do(A=0) path cache: {n} lookups served from {st['computed']} computed paths "
+            f"(hit rate {rate:.1%})")
+
+def run_all_tags_and_write(df_obs: pd.DataFrame, run_tags, effects_base: dict, out_path: str) -> pd.DataFrame:
+    """
+    All ablations over the whole cohort in one pass: a (tag x row x node) array
+    written long (tag-major, then stay_id, t) to out_path. Per-tag tables are
+    contiguous slices of the returned frame.
+    """
+    run_tags = list(run_tags)
+    K = effects_tensor(effects_base, run_tags)
+    sid_all = df_obs["stay_id"].to_numpy()
+    t_all = df_obs["t"].to_numpy()
+    starts, ends = stay_offsets(sid_all)
+    lens = ends - starts
+    paths = doA0_trajectories([dict(zip(FLAT_KEYS, k)) for k in K], int(lens.max(initial=0)))
+    pos = np.arange(sid_all.size) - np.repeat(starts, lens)      # row offset within its stay
+    res = paths[:, pos]
+    out = pd.DataFrame({
+        "stay_id": np.tile(sid_all, len(run_tags)),
+        "t": np.tile(t_all, len(run_tags)),
+        "run_tag": np.repeat(run_tags, sid_all.size),
+        "B_hat_doA0": res[..., 0].ravel(),
+        "C_hat_doA0": res[..., 1].ravel(),
+        "D_hat_doA0": res[..., 2].ravel(),
+        "E_hat_doA0": res[..., 3].ravel(),
+    })
+    out.to_csv(out_path, index=False)
+    return out
+
+def _stationary_sd(K: np.ndarray, sig: np.ndarray) -> np.ndarray:
+    """(n_tags, 4) stationary sd of the noisy recursion: V = F V F' + S solved as a 16x16 system."""
+    out = np.empty((K.shape[0], 4))
+    for j, k in enumerate(K):
+        f = dict(zip(FLAT_KEYS, k))
+        F = np.diag([f["phi_B"], f["phi_C"], f["phi_D"], f["phi_E"]])
+        F[1, 0] = f["kB_C"]
+        F[2, 1] = f["kC_D"]; F[2, 0] = f["kB_D"]
+        F[3, 2] = f["kD_E"]; F[3, 1] = f["kC_E"]; F[3, 0] = f["kB_E"]
+        V = np.linalg.solve(np.eye(16) - np.kron(F, F), np.diag(sig ** 2).ravel()).reshape(4, 4)
+        out[j] = np.sqrt(np.maximum(np.diag(V), 0.0))
+    return out
+
+def _sketch_quantile(hist, n, lo, hi, q):
+    """Quantile q from fixed-range histograms (..., bins), interpolated within the bin."""
+    bins = hist.shape[-1]; w = (hi - lo) / bins
+    cum = np.cumsum(hist, axis=-1); k = q * n[..., None]
+    j = np.minimum((cum < k).sum(axis=-1, keepdims=True), bins - 1)
+    below = np.where(j > 0, np.take_along_axis(cum, np.maximum(j - 1, 0), -1), 0)
+    inbin = np.take_along_axis(hist, j, -1)
+    frac = np.divide(k - below, inbin, out=np.zeros(inbin.shape), where=inbin > 0)
+    return (lo + (j + frac) * w)[..., 0]
+
+def run_mc_and_write(df_obs: pd.DataFrame, run_tags, effects_base: dict, sig: np.ndarray, seed: int,
+                     n_draws: int, out_path: str) -> pd.DataFrame:
+    """
+    Stochastic do(A=0): every non-initial step gets N(0, sigma^2) shocks per node.
+    Each stay draws its (n_draws, rows, 4) shocks from its own stream
+    SeedSequence(seed, spawn_key=(stay_id,)), so results do not depend on cohort
+    order or chunking. Chunks are reduced straight into per-(tag, t) count,
+    mean and M2 (merged as in Chan et al.), min/max and a histogram sketch; the
+    draws are never kept.
+    """
+    run_tags = list(run_tags)
+    K = effects_tensor(effects_base, run_tags)
+    J = K.shape[0]
+    sid_all = df_obs["stay_id"].to_numpy()
+    t_all = df_obs["t"].to_numpy()
+    starts, ends = stay_offsets(sid_all)
+    lens = ends - starts
+    t_lo = int(t_all.min()) if t_all.size else 0
+    ti_all = t_all - t_lo
+    nT = int(ti_all.max()) + 1 if t_all.size else 0
+
+    det = doA0_trajectories([dict(zip(FLAT_KEYS, k)) for k in K], int(lens.max(initial=1)))
+    sd = _stationary_sd(K, sig)
+    lo = det.min(axis=1) - MC_Q_SPAN * sd; hi = det.max(axis=1) + MC_Q_SPAN * sd
+    hi = np.maximum(hi, lo + 1e-12)                           # sigma == 0: one degenerate bin range
+    lo_, w_ = lo[:, None, None, :], ((hi - lo) / MC_Q_BINS)[:, None, None, :]
+
+    cnt = np.zeros(nT); mean = np.zeros((J, nT, 4)); m2 = np.zeros((J, nT, 4))
+    mn = np.full((J, nT, 4), np.inf); mx = np.full((J, nT, 4), -np.inf)
+    hist = np.zeros(J * nT * 4 * MC_Q_BINS, dtype=np.int64)
+    base_idx = (np.arange(J)[:, None, None, None] * nT * 4 + np.arange(4)[None, None, None, :]) * MC_Q_BINS
+
+    chunk_id = np.cumsum(lens) // max(1, MC_CHUNK_ROWS)
+    bounds = np.flatnonzero(np.r_[True, chunk_id[1:] != chunk_id[:-1], True])
+    for a, b in tqdm(zip(bounds[:-1], bounds[1:]), total=bounds.size - 1, desc=" mc", unit="chunk"):
+        r0, r1 = starts[a], ends[b - 1]
+        eps = np.concatenate([
+            np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(int(sid_all[st]),)))
+              .standard_normal((n_draws, en - st, 4))
+            for st, en in zip(starts[a:b], ends[a:b])], axis=1) * sig
+        V = simulate_doA0_cohort(starts[a:b] - r0, ends[a:b] - r0, K, noise=eps)   # (J, M, rows, 4)
+        ti = ti_all[r0:r1]
+        nc = np.bincount(ti, minlength=nT) * n_draws
+        mc = np.zeros((J, nT, 4)); m2c = np.zeros((J, nT, 4))
+        for j in range(J):
+            for k in range(4):
+                mc[j, :, k] = np.bincount(ti, weights=V[j, :, :, k].sum(axis=0), minlength=nT)
+        mc /= np.maximum(nc, 1)[None, :, None]
+        for j in range(J):
+            for k in range(4):
+                m2c[j, :, k] = np.bincount(ti, weights=((V[j, :, :, k] - mc[j, ti, k]) ** 2).sum(axis=0), minlength=nT)
+        tot = cnt + nc
+        f = np.divide(nc, tot, out=np.zeros(nT), where=tot > 0)[None, :, None]
+        d = mc - mean
+        mean += d * f
+        m2 += m2c + d ** 2 * (cnt[None, :, None] * f)
+        cnt = tot
+        np.minimum.at(mn, (slice(None), ti), V.min(axis=1))
+        np.maximum.at(mx, (slice(None), ti), V.max(axis=1))
+        bi = np.clip(((V - lo_) / w_).astype(np.int64), 0, MC_Q_BINS - 1)
+        flat = base_idx + (ti[None, None, :, None] * 4) * MC_Q_BINS + bi
+        hist += np.bincount(flat.ravel(), minlength=hist.size)
+
+    hist = hist.reshape(J, nT, 4, MC_Q_BINS)
+    keep = cnt > 0
+    n = np.broadcast_to(cnt[None, :, None], (J, nT, 4))
+    var = m2 / np.maximum(n - 1, 1)
+    cols = {"run_tag": np.repeat(run_tags, keep.sum()),
+            "t": np.tile(np.flatnonzero(keep) + t_lo, J),
+            "n": np.tile(cnt[keep].astype(np.int64), J)}
+    qs = [np.clip(_sketch_quantile(hist, n, lo[:, None, :, None], hi[:, None, :, None], q), mn, mx)
+          for q in MC_QUANTILES]
+    for k, node in enumerate(["B", "C", "D", "E"]):
+        cols[f"{node}_hat_doA0_mean"] = mean[:, keep, k].ravel()
+        cols[f"{node}_hat_doA0_sd"] = np.sqrt(var[:, keep, k]).ravel()
+        for q, qv in zip(MC_QUANTILES, qs):
+            cols[f"{node}_hat_doA0_q{int(round(q * 100)):02d}"] = qv[:, keep, k].ravel()
+    out = pd.DataFrame(cols)
+    out.to_csv(out_path, index=False)
+    return out
+
+def _run_hours(x, first):
+    """Length of the current run of x == 1 at each row, restarting at stay starts (0 where x == 0)."""
+    idx = np.arange(x.size)
+    brk = np.where(x == 0, idx, -1)
+    brk = np.maximum(brk, np.where(first, idx - 1, -1))
+    return np.where(x == 1, idx - np.maximum.accumulate(brk), 0)
+
+def _stay_cumsum(x, starts, ends):
+    cs = np.cumsum(x)
+    return cs - np.repeat(cs[starts] - x[starts], ends - starts)
+
+def policy_name(kind: str, arg) -> str:
+    return kind if arg is None else f"{kind}_{arg:g}"
+
+def apply_policy(kind: str, arg, A_low, A_value, starts, ends, thr: float, u=None) -> np.ndarray:
+    """Intervened exposure path (float, cohort order) for one policy; u: (rows,) uniforms for stochastic."""
+    A = A_low.astype(np.float64)
+    first = np.zeros(A.size, dtype=bool); first[starts] = True
+    if kind == "observed":
+        return A
+    if kind == "static":
+        return np.full(A.size, float(arg))
+    if kind == "shift":
+        return np.where(np.isnan(A_value), A, (A_value + arg < thr).astype(np.float64))
+    if kind == "cap":
+        return A * (_stay_cumsum(A, starts, ends) <= arg)
+    if kind == "delay":
+        return A * (_run_hours(A_low, first) <= arg)
+    if kind == "stochastic":
+        return A * (u >= arg)
+    _err(f"unknown policy kind '{kind}'")
+
+def run_policies_and_write(df_obs: pd.DataFrame, policies, effects_base: dict, thr: float, seed: int,
+                           out_path: str, run_tag: str = POLICY_TAG) -> pd.DataFrame:
+    """
+    All policies over the whole cohort: for each chunk of whole stays the
+    intervened paths are built as one (P, rows) array and pushed through
+    simulate_doA0_cohort together, reducing straight to per-(policy, t) means
+    of A and B..E. Stochastic policy i draws each stay's uniforms from its own
+    stream SeedSequence(seed, spawn_key=(stay_id, i)), as the MC path does, so
+    results do not depend on cohort order or POLICY_CHUNK_ROWS.
+    """
+    names = [policy_name(k, a) for k, a in policies]
+    K = effects_tensor(effects_base, [run_tag])
+    sid_all = df_obs["stay_id"].to_numpy()
+    t_all = df_obs["t"].to_numpy()
+    starts, ends = stay_offsets(sid_all)
+    A_low = df_obs["A_low"].to_numpy()
+    A_value = df_obs["A_value"].to_numpy(np.float64)
+    t_lo = int(t_all.min()) if t_all.size else 0
+    ti_all = t_all - t_lo
+    nT = int(ti_all.max()) + 1 if t_all.size else 0
+    P = len(policies)
+    cnt = np.zeros(nT); sA = np.zeros((P, nT)); sV = np.zeros((P, nT, 4))
+
+    chunk_id = np.cumsum(ends - starts) // max(1, POLICY_CHUNK_ROWS)
+    bounds = np.flatnonzero(np.r_[True, chunk_id[1:] != chunk_id[:-1], True]) if starts.size else np.array([0])
+    for a, b in tqdm(zip(bounds[:-1], bounds[1:]), total=bounds.size - 1, desc=" policies", unit="chunk"):
+        r0, r1 = starts[a], ends[b - 1]
+        s_loc, e_loc = starts[a:b] - r0, ends[a:b] - r0
+        u = lambda i: np.concatenate([
+            np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(int(sid_all[st]), i))).random(en - st)
+            for st, en in zip(starts[a:b], ends[a:b])])
+        Apol = np.stack([apply_policy(k, arg, A_low[r0:r1], A_value[r0:r1], s_loc, e_loc, thr,
+                                      u(i) if k == "stochastic" else None)
+                         for i, (k, arg) in enumerate(policies)])
+        V = simulate_doA0_cohort(s_loc, e_loc, K, A=Apol)[0]                  # (P, rows, 4)
+        ti = ti_all[r0:r1]
+        cnt += np.bincount(ti, minlength=nT)
+        for p in range(P):
+            sA[p] += np.bincount(ti, weights=Apol[p], minlength=nT)
+            for k in range(4):
+                sV[p, :, k] += np.bincount(ti, weights=V[p, :, k], minlength=nT)
+
+    keep = cnt > 0
+    n = cnt[keep]
+    cols = {"policy": np.repeat(names, keep.sum()),
+            "t": np.tile(np.flatnonzero(keep) + t_lo, P),
+            "n": np.tile(n.astype(np.int64), P),
+            "A_mean": (sA[:, keep] / n).ravel()}
+    for k, node in enumerate(["B", "C", "D", "E"]):
+        cols[f"{node}_hat_pol_mean"] = (sV[:, keep, k] / n).ravel()
+    out = pd.DataFrame(cols)
+    out.to_csv(out_path, index=False)
+    return out
+
+def doA0_tangents(k: np.ndarray, horizon: int) -> np.ndarray:
+    """
+    Forward-mode derivatives of the do(A=0) path for one effects row k (FLAT_KEYS
+    order): (horizon, 4, len(SENS_KEYS)). The path is x_i = c + F x_{i-1} with
+    x_0 = baselines, so its tangents follow the same recursion driven by
+    dc + dF x_{i-1}. The kA_* derivatives are zero since A_prev = 0.
+    """
+    f = dict(zip(FLAT_KEYS, k))
+    nodes = ["B", "C", "D", "E"]
+    base = np.asarray(k[:4], dtype=np.float64)
+    phi = np.array([f[f"phi_{n}"] for n in nodes])
+    F = np.diag(phi)
+    for key in SENS_KEYS[4:]:
+        if key[1] != "A":
+            F[nodes.index(key[3]), nodes.index(key[1])] = f[key]
+    c = base * (1.0 - phi)
+    P = len(SENS_KEYS)
+    dc = np.zeros((P, 4)); dF = np.zeros((P, 4, 4))
+    dc[np.arange(4), np.arange(4)] = 1.0 - phi
+    for p, key in enumerate(SENS_KEYS[4:], start=4):
+        if key[1] != "A":
+            dF[p, nodes.index(key[3]), nodes.index(key[1])] = 1.0
+    x = base.copy()
+    dx = np.zeros((P, 4)); dx[np.arange(4), np.arange(4)] = 1.0
+    out = np.empty((horizon, 4, P))
+    if horizon:
+        out[0] = dx.T
+    for i in range(1, horizon):
+        dx = dc + dx @ F.T + dF @ x
+        x = c + F @ x
+        out[i] = dx.T
+    return out
+
+def run_sens_and_write(df_obs: pd.DataFrame, run_tag: str, effects_base: dict, out_path: str) -> pd.DataFrame:
+    """Per-row d(X_hat_doA0)/d(param); the tangent path is stay-independent like the path itself."""
+    K = effects_tensor(effects_base, [run_tag])
+    free = spec_mask([run_tag])[0, :len(SENS_KEYS)]       # kappas zeroed by the tag are constants
+    sid_all = df_obs["stay_id"].to_numpy()
+    starts, ends = stay_offsets(sid_all)
+    lens = ends - starts
+    tan = doA0_tangents(K[0], int(lens.max(initial=0))) * free
+    g = tan[np.arange(sid_all.size) - np.repeat(starts, lens)]          # (rows, 4, P)
+    cols = {"stay_id": sid_all, "t": df_obs["t"].to_numpy(), "run_tag": run_tag}
+    for k, node in enumerate(["B", "C", "D", "E"]):
+        for p, key in enumerate(SENS_KEYS):
+            cols[f"d{node}_hat_doA0__{key}"] = g[:, k, p]
+    out = pd.DataFrame(cols)
+    out.to_csv(out_path, index=False)
+    return out
+
+def tag_view(df_all: pd.DataFrame, run_tag: str) -> pd.DataFrame:
+    return df_all[df_all["run_tag"] == run_tag].reset_index(drop=True)
+
 def main():
     for d in [OUT63_DIR, OUT63_DIR]:
         if not os.path.isdir(d):
             os.makedirs(d, exist_ok=True)
     effects_base = load_params(PARAMS_YAML)
-    df_obs = load_observed(INPUT_OBS)
-
-    run_tag_and_write(df_obs, "Full_main", effects_base, OUT_FULL)
-    run_tag_and_write(df_obs, "NoAtoB",   effects_base, OUT_NOA2B)
-    run_tag_and_write(df_obs, "NoBtoC",   effects_base, OUT_NOB2C)
-    run_tag_and_write(df_obs, "NoCtoD",   effects_base, OUT_NOC2D)
-    run_tag_and_write(df_obs, "None",     effects_base, OUT_NONE)
-
-    run_tag_and_write(df_obs, "NoAtoE",   effects_base, OUT_NOA2E)
-    run_tag_and_write(df_obs, "NoBtoE",   effects_base, OUT_NOB2E)
-    run_tag_and_write(df_obs, "NoCtoE",   effects_base, OUT_NOC2E)
-    run_tag_and_write(df_obs, "NoDtoE",   effects_base, OUT_NOD2E)
-    run_tag_and_write(df_obs, "NoneE",    effects_base, OUT_NONE_E)
+    df_obs = load_observed(INPUT_OBS, extra_cols=HAT_COLS if ONSET_TAGS else ())
+
+    df_all = run_all_tags_and_write(df_obs, TAG_OUTS.keys(), effects_base, OUT_ALL)
+    for tag, path in TAG_OUTS.items():
+        tag_view(df_all, tag).to_csv(path, index=False)
+
+    for tag in ONSET_TAGS:
+        run_onset_tag_and_write(df_obs, tag, effects_base, OUT_ONSET_FMT.format(tag=tag))
+    for tag in SENS_TAGS:
+        run_sens_and_write(df_obs, tag, effects_base, OUT_SENS_FMT.format(tag=tag))
+    if MC_DRAWS > 0:
+        sig, seed = load_noise(PARAMS_YAML)
+        run_mc_and_write(df_obs, MC_TAGS, effects_base, sig, seed, MC_DRAWS, OUT_MC)
+    if POLICIES:
+        thr, seed = load_policy_conf(PARAMS_YAML)
+        run_policies_and_write(df_obs, POLICIES, effects_base, thr, seed, OUT_POLICY)
+    print(cache_report())
 
 if __name__ == "__main__":
     main()
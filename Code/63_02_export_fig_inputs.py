@@ -1,5 +1,5 @@
 
-import os, time
+import os, time, hashlib, shutil, tempfile
 import numpy as np
 import pandas as pd
 
@@ -22,6 +22,10 @@ OUT_ABCD_SINGLE = os.path.join(OUT63_DIR, "631_A_to_BCD_inst_counterfactual.csv"
 OUT_AE_ALL      = os.path.join(OUT63_DIR, "631_A_to_E_cum_counterfactual.ALL.csv")
 OUT_ABCD_ALL    = os.path.join(OUT63_DIR, "631_A_to_BCD_inst_counterfactual.ALL.csv")
 OUT_AE_METRICS  = os.path.join(OUT63_DIR, "631_metrics_AE_all.csv")
+OUT_ALIGN_STATS = os.path.join(OUT63_DIR, "631_align_stats.csv")   # n/mean/sd/quantiles per (tag, series, lag)
+
+# long file with every tag from 63_01; read once by the fused path
+IN_DO_ALL = os.path.join(OUT63_DIR, "631_do__ALL.csv")
 
 DO_FILES_EONLY = [
     os.path.join(OUT63_DIR, "632_do__NoAtoE.csv"),
@@ -32,6 +36,19 @@ DO_FILES_EONLY = [
 ]
 OUT_AE_EONLY_ALL = os.path.join(OUT63_DIR, "632_A_to_E_cum_counterfactual.EONLY.ALL.csv")
 
+# forward-mode sensitivities from 62_02 (observed hats) and 63_01 (do paths)
+IN_SENS_OBS = os.path.join(IN_DIR, "62_observed_sens.csv")
+SENS_FILES  = [
+    os.path.join(OUT63_DIR, "631_sens__Full_main.csv"),
+]
+OUT_SENS_AE      = os.path.join(OUT63_DIR, "631_sens_AE_per_lag.csv")
+OUT_SENS_BCD     = os.path.join(OUT63_DIR, "631_sens_BCD_per_lag.csv")
+OUT_SENS_METRICS = os.path.join(OUT63_DIR, "631_sens_metrics_AE.csv")
+
+# onset index written by 62_02; validated here by (size, mtime), then sha1, of its sources
+ONSET_INDEX = os.path.join(IN_DIR, "62_onsets.npz")
+LOG_TAG = "[62_06]"
+
 # ===== params =====
 ID_COL="stay_id"; T_COL="t"
 A_LOW="A_low"; B_FLAG="B_on"; C_FLAG="C_low"; D_FLAG="D_high"; E_FLAG="E_on"
@@ -39,79 +56,271 @@ B_HAT="B_hat"; C_HAT="C_hat"; D_HAT="D_hat"; E_HAT="E_hat"
 B_HAT_CF="B_hat_doA0"; C_HAT_CF="C_hat_doA0"; D_HAT_CF="D_hat_doA0"; E_HAT_CF="E_hat_doA0"
 LAG_PRE=-12; LAG_POST=24
 PROG_STEP=10
+FUSED=True          # all tags in one gather pass in this process; False = one pool task per do file
+ALIGN_CHUNK=1<<16   # onsets per streamed chunk; peak memory is ALIGN_CHUNK x lags per series
+ACC_BINS=256        # histogram-sketch bins per lag for the quantiles in OUT_ALIGN_STATS
+ACC_Q=[0.05,0.25,0.5,0.75,0.95]
+ONSET_FLAGS=[A_LOW,B_FLAG,C_FLAG,D_FLAG]
+_ONSET_IDX=None
+COHORT_COLS=[ID_COL,T_COL,B_HAT,C_HAT,D_HAT,E_HAT]   # what the pool workers read from the observed cohort
+_SHARED=None
 
 # ===== utils =====
 def _need(df, cols, where):
     miss=[c for c in cols if c not in df.columns]
     if miss: raise KeyError(f"{where}: missing {miss}")
 
-def _onsets(x: np.ndarray)->np.ndarray:
-    x=x.astype(np.int8); prev=np.r_[0,x[:-1]]
-    return (x==1)&(prev==0)
+# ----- onset index reader: _src_hash, _src_stat and _load_onset_index are kept line-for-line
+# across 62_03 fig6B, 62_03 fig6C and 63_02 (scripts are standalone); 62_02 writes the index -----
+def _src_hash(paths) -> str:
+    h = hashlib.sha1()
+    for p in paths:
+        with open(p, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 24), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+def _src_stat(paths) -> np.ndarray:
+    """(size, mtime_ns) per path: the cheap check tried before _src_hash."""
+    return np.array([(os.stat(p).st_size, os.stat(p).st_mtime_ns) for p in paths], dtype=np.int64).reshape(-1, 2)
+
+def _build_onsets(df: pd.DataFrame, flags)->dict:
+    """Rising edges of every flag over the (stay, t)-sorted cohort; the previous hour counts as 0 at each stay start."""
+    sid=df[ID_COL].to_numpy(); valid=df[ID_COL].notna().to_numpy()
+    first=np.ones(len(df),dtype=bool); first[1:]=sid[1:]!=sid[:-1]
+    start=np.flatnonzero(first&valid); stay_of=np.cumsum(first&valid)-1
+    rows,codes=[],[]
+    for k,f in enumerate(flags):
+        x=df[f].to_numpy().astype(np.int8); prev=np.r_[0,x[:-1]]; prev[first]=0
+        r=np.flatnonzero((x==1)&(prev==0)&valid); rows.append(r); codes.append(np.full(r.size,k,dtype=np.int8))
+    rows=np.concatenate(rows)
+    return {"stays":sid[start],"start":start,"stay":stay_of[rows].astype(np.int32),"row":rows,
+            "t0":df[T_COL].to_numpy(np.int64)[rows],"flag":np.concatenate(codes),
+            "flags":np.asarray(flags),"n_rows":np.int64(len(df))}
+
+def _load_onset_index(df: pd.DataFrame) -> dict:
+    """
+    Onset index of ONSET_FLAGS for the (stay, t)-sorted cohort df, as written
+    by 62_02. Its source files are checked by (size, mtime) first and by sha1
+    only if those moved; if neither matches, the onsets are built in memory
+    and nothing is written.
+    """
+    global _ONSET_IDX
+    if _ONSET_IDX is not None: return _ONSET_IDX
+    idx = None
+    if os.path.isfile(ONSET_INDEX):
+        with np.load(ONSET_INDEX, allow_pickle=False) as z:
+            idx = {k: z[k] for k in z.files}
+        src = [str(p) for p in idx.get("src", [])]
+        ok = (src and list(idx["flags"]) == ONSET_FLAGS and int(idx["n_rows"]) == len(df)
+              and all(os.path.isfile(p) for p in src))
+        if not (ok and (("stat" in idx and np.array_equal(idx["stat"], _src_stat(src)))
+                        or str(idx["key"]) == _src_hash(src))):
+            idx = None
+    if idx is None:
+        print(f"{LOG_TAG} {ONSET_INDEX} missing or stale (rerun 62_02); building onsets in memory", flush=True)
+        idx = _build_onsets(df, ONSET_FLAGS)
+    _ONSET_IDX = idx
+    return idx
 
 def extract_onsets(df: pd.DataFrame, flag_col: str)->pd.DataFrame:
-    rows=[]
-    for sid,g in df.groupby(ID_COL, sort=False):
-        idx=np.flatnonzero(_onsets(g[flag_col].to_numpy()))
-        if idx.size: rows.append(pd.DataFrame({ID_COL:sid,"t0":g.iloc[idx][T_COL].to_numpy(np.int64)}))
-    return pd.concat(rows, ignore_index=True) if rows else pd.DataFrame(columns=[ID_COL,"t0"])
-
-def _build_index(df: pd.DataFrame, val_col: str):
-    by,pos,tmin,tmax={}, {}, {}, {}
-    for sid,g in df.groupby(ID_COL, sort=False):
-        ts=g[T_COL].to_numpy(np.int64); vs=g[val_col].to_numpy()
-        by[sid]=(ts,vs); pos[sid]={int(t):i for i,t in enumerate(ts)}
-        tmin[sid]=int(ts.min()); tmax[sid]=int(ts.max())
-    return by,pos,tmin,tmax
+    idx=_load_onset_index(df) if flag_col in ONSET_FLAGS else _build_onsets(df,[flag_col])
+    sel=idx["flag"]==list(idx["flags"]).index(flag_col)
+    if not sel.any(): return pd.DataFrame(columns=[ID_COL,"t0"])
+    return pd.DataFrame({ID_COL:idx["stays"][idx["stay"][sel]],"t0":idx["t0"][sel]})
+
+# _row_key/_event_rows/_event_order/_take: same code as the copy in 62_03 fig6B (scripts are
+# standalone), in this file's spacing; change both together
+def _row_key(df: pd.DataFrame):
+    """Packed (stay rank, hour) key of every row of df sorted by (stay, t), for _event_rows lookups."""
+    sid=df[ID_COL].to_numpy(); t=df[T_COL].to_numpy(np.int64)
+    if sid.size==0: return None
+    uniq,rank=np.unique(sid,return_inverse=True)
+    tmin=int(t.min()); span=int(t.max())-tmin+1
+    return uniq,rank.astype(np.int64)*span+(t-tmin),tmin,span
+
+def _event_rows(df: pd.DataFrame, trig: pd.DataFrame, lags, rk=None)->np.ndarray:
+    """(n_events, n_lags) row of (stay, t0+lag) in df sorted by (stay, t); -1 where that hour is absent."""
+    rk=_row_key(df) if rk is None else rk
+    if rk is None: return np.full((len(trig),len(lags)),-1,dtype=np.int64)
+    uniq,key,tmin,span=rk
+    ev_sid=trig[ID_COL].to_numpy(); t0=trig["t0"].to_numpy(np.int64)
+    er=np.clip(np.searchsorted(uniq,ev_sid),0,uniq.size-1); known=uniq[er]==ev_sid
+    off=t0[:,None]+np.asarray(lags,dtype=np.int64)[None,:]-tmin
+    q=er[:,None].astype(np.int64)*span+off
+    pos=np.clip(np.searchsorted(key,q),0,key.size-1)
+    hit=known[:,None]&(off>=0)&(off<span)&(key[pos]==q)
+    return np.where(hit,pos,-1)
+
+def _event_order(trig: pd.DataFrame)->np.ndarray:
+    """Event positions in trig.groupby(ID_COL, sort=False) order, the order the per-stay loops visited them."""
+    codes,_=pd.factorize(trig[ID_COL])
+    order=np.argsort(codes,kind="stable")
+    return order[codes[order]>=0]
+
+def _take(v: np.ndarray, idx: np.ndarray)->np.ndarray:
+    """v[..., idx] with NaN where idx is -1; v may carry leading (tag, column) axes."""
+    if v.shape[-1]==0: return np.full(v.shape[:-1]+idx.shape,np.nan)
+    return np.where(idx>=0,v[...,np.maximum(idx,0)],np.nan)
+
+def _rebase(vals, b):
+    """max(cum[t0+L] - base, 0) and its mask; b holds cum at t0-1 and t0, base is the first when finite."""
+    base=np.where(np.isfinite(b[:,0]),b[:,0],b[:,1])
+    ok=np.isfinite(base)[:,None]&np.isfinite(vals)
+    with np.errstate(invalid="ignore"):
+        return np.maximum(vals-base[:,None],0.0),ok
+
+# ----- mergeable per-lag accumulators -----
+def _acc_new(n_lags, lo, hi):
+    """
+    count, sum, centred sum of squares and a histogram sketch on a fixed
+    [lo, hi] grid per lag. Accumulators on the same grid merge exactly
+    (Chan et al. for m2), so chunks and workers combine in any grouping.
+    """
+    if not (np.isfinite(lo) and np.isfinite(hi)) or hi<=lo: hi=(lo if np.isfinite(lo) else 0.0)+1.0
+    lo=lo if np.isfinite(lo) else 0.0
+    return {"n":np.zeros(n_lags,dtype=np.int64),"s":np.zeros(n_lags),"m2":np.zeros(n_lags),
+            "lo":float(lo),"hi":float(hi),"h":np.zeros((n_lags,ACC_BINS),dtype=np.int64)}
+
+def _acc_grid(v, cum):
+    """Sketch range of a series: its finite range, or [0, range] for rebased increments."""
+    f=v[np.isfinite(v)]
+    if f.size==0: return 0.0,1.0
+    return (0.0,float(f.max()-f.min())) if cum else (float(f.min()),float(f.max()))
+
+def _acc_merge(a, b):
+    n=a["n"]+b["n"]
+    with np.errstate(invalid="ignore",divide="ignore"):
+        d=np.where((a["n"]>0)&(b["n"]>0),b["s"]/np.maximum(b["n"],1)-a["s"]/np.maximum(a["n"],1),0.0)
+        m2=a["m2"]+b["m2"]+d*d*a["n"]*b["n"]/np.maximum(n,1)
+    return {**a,"n":n,"s":a["s"]+b["s"],"m2":m2,"h":a["h"]+b["h"]}
+
+def _acc_add(acc, vals, ok):
+    """Fold one chunk of (n_events, n_lags) samples into acc. A single chunk reproduces np.mean exactly."""
+    nl=vals.shape[1]; c=_acc_new(nl,acc["lo"],acc["hi"])
+    for j in range(nl):
+        x=vals[ok[:,j],j]
+        if x.size:
+            c["n"][j]=x.size; c["s"][j]=np.sum(x); c["m2"][j]=np.sum((x-c["s"][j]/x.size)**2)
+    w=(acc["hi"]-acc["lo"])/ACC_BINS
+    with np.errstate(invalid="ignore"):
+        bi=np.clip(np.floor((vals-acc["lo"])/w),0,ACC_BINS-1)
+    bi=np.where(ok,bi,0).astype(np.int64)+np.arange(nl)[None,:]*ACC_BINS
+    c["h"]=np.bincount(bi[ok],minlength=nl*ACC_BINS).reshape(nl,ACC_BINS)
+    return _acc_merge(acc,c)
+
+def _acc_frame(acc, lags):
+    """The (lag, mean, n) curve the align_* functions return."""
+    return pd.DataFrame({"lag":np.asarray(lags,dtype=int),
+                         "mean":[float(s/n) if n else np.nan for s,n in zip(acc["s"],acc["n"])],
+                         "n":acc["n"].astype(int)})
+
+def _acc_stats(acc, lags):
+    """(lag, n, mean, sd, q*) with quantiles read off the sketch, linear within a bin."""
+    n=acc["n"]; ok=n>0
+    with np.errstate(invalid="ignore",divide="ignore"):
+        out={"lag":np.asarray(lags,dtype=int),"n":n,"mean":np.where(ok,acc["s"]/np.maximum(n,1),np.nan),
+             "sd":np.where(n>1,np.sqrt(acc["m2"]/np.maximum(n-1,1)),np.nan)}
+        cdf=np.cumsum(acc["h"],axis=1); w=(acc["hi"]-acc["lo"])/ACC_BINS
+        for q in ACC_Q:
+            k=q*n; b=np.minimum((cdf<k[:,None]).sum(axis=1),ACC_BINS-1)
+            below=np.where(b>0,np.take_along_axis(cdf,np.maximum(b-1,0)[:,None],axis=1)[:,0],0)
+            inb=acc["h"][np.arange(len(n)),b]
+            frac=np.where(inb>0,(k-below)/np.maximum(inb,1),0.0)
+            out[f"q{int(round(q*100)):02d}"]=np.where(ok,acc["lo"]+(b+np.clip(frac,0,1))*w,np.nan)
+    return pd.DataFrame(out)
+
+def _stream_align(df, trig, lags, series, tag=None, rk=None, order=None):
+    """
+    Stream trig through the gather in ALIGN_CHUNK onsets at a time and fold
+    every series into its accumulator. series maps name -> (values over the
+    rows of df, cum); cum series are rebased increments. Returns name -> acc.
+    rk/order are _row_key(df)/_event_order(trig), built here when not given.
+    """
+    rk=_row_key(df) if rk is None else rk
+    ev=trig.iloc[_event_order(trig) if order is None else order]
+    acc={k:_acc_new(len(lags),*_acc_grid(v,cum)) for k,(v,cum) in series.items()}
+    n_chunks=max(1,-(-len(ev)//ALIGN_CHUNK))
+    for i,a in enumerate(range(0,max(len(ev),1),ALIGN_CHUNK),1):
+        e=ev.iloc[a:a+ALIGN_CHUNK]
+        idx=_event_rows(df,e,lags,rk); bidx=None
+        for k,(v,cum) in series.items():
+            vals=_take(v,idx)
+            if cum:
+                bidx=_event_rows(df,e,[-1,0],rk) if bidx is None else bidx
+                vals,ok=_rebase(vals,_take(v,bidx))
+            else:
+                ok=np.isfinite(vals)
+            acc[k]=_acc_add(acc[k],vals,ok)
+        if tag is not None and n_chunks>1: print(f"[62_06] align {tag} chunk {i}/{n_chunks}", flush=True)
+    return acc
 
 def align_mean(df,trig,val_col,lag_pre,lag_post,tag):
     lags=np.arange(lag_pre,lag_post+1,dtype=int)
-    by,pos,tmin,tmax=_build_index(df,val_col)
-    rows=[]; total=len(lags)
-    for i,L in enumerate(lags,1):
-        vals=[]
-        for sid,g0 in trig.groupby(ID_COL,sort=False):
-            if sid not in by: continue
-            ts,vs=by[sid]; m=pos[sid]
-            for t0 in g0["t0"].to_numpy(np.int64):
-                tt=int(t0+L)
-                if tt<tmin[sid] or tt>tmax[sid]: continue
-                j=m.get(tt,None)
-                if j is None: continue
-                v=vs[j]
-                if np.isfinite(v): vals.append(float(v))
-        rows.append((int(L), float(np.mean(vals)) if vals else np.nan, int(len(vals))))
-        if (i%PROG_STEP==0) or (i==total): print(f"[62_06] align {tag} {i}/{total}", flush=True)
-    return pd.DataFrame(rows, columns=["lag","mean","n"])
+    acc=_stream_align(df,trig,lags,{val_col:(df[val_col].to_numpy(np.float64),False)},tag)[val_col]
+    return _acc_frame(acc,lags)
 
 def align_cum_rebased(df,trig,cum_col,lag_pre,lag_post,tag):
+    """Mean of max(cum[t0+L] - base, 0); base is cum[t0-1] when finite, else cum[t0]."""
     lags=np.arange(lag_pre,lag_post+1,dtype=int)
-    by,pos,tmin,tmax=_build_index(df,cum_col)
-    rows=[]; total=len(lags)
-    for i,L in enumerate(lags,1):
-        vals=[]
-        for sid,g0 in trig.groupby(ID_COL,sort=False):
-            if sid not in by: continue
-            ts,vs=by[sid]; m=pos[sid]
-            for t0 in g0["t0"].to_numpy(np.int64):
-                t_base=int(t0-1); j_base=m.get(t_base,None)
-                base=float(vs[j_base]) if (j_base is not None and np.isfinite(vs[j_base])) else (
-                      float(vs[m.get(int(t0),None)]) if m.get(int(t0),None) is not None else np.nan)
-                if not np.isfinite(base): continue
-                tt=int(t0+L)
-                if tt<tmin[sid] or tt>tmax[sid]: continue
-                j=m.get(tt,None)
-                if j is None or not np.isfinite(vs[j]): continue
-                inc=float(vs[j])-base
-                if inc<0.0: inc=0.0
-                vals.append(inc)
-        rows.append((int(L), float(np.mean(vals)) if vals else np.nan, int(len(vals))))
-        if (i%PROG_STEP==0) or (i==total): print(f"[62_06] align {tag} {i}/{total}", flush=True)
-    return pd.DataFrame(rows, columns=["lag","mean","n"])
-
-def _pair(df, evA, v_obs, v_cf, taglbl, obs_name, cf_name, zero_align_at=-1):
-    o = align_mean(df, evA, v_obs, LAG_PRE, LAG_POST, f"{taglbl} obs")
-    c = align_mean(df, evA, v_cf,  LAG_PRE, LAG_POST, f"{taglbl} cf")
+    acc=_stream_align(df,trig,lags,{cum_col:(df[cum_col].to_numpy(np.float64),True)},tag)[cum_col]
+    return _acc_frame(acc,lags)
+
+def _sens_align(df, trig, v_col, D, cum):
+    """
+    Per-lag means of v_col and of its tangents D (rows, P) over the same
+    event/lag samples align_mean (cum=False) or align_cum_rebased (cum=True)
+    average; the rebased increment is floored at 0, so its tangent is
+    dropped where the floor binds. Returns (mean (n_lags,), dmean (n_lags, P), n).
+    """
+    lags=np.arange(LAG_PRE,LAG_POST+1,dtype=int)
+    v=df[v_col].to_numpy(np.float64)
+    idx=_event_rows(df,trig,lags); ok=idx>=0; ii=np.maximum(idx,0)
+    vv=np.where(ok,v[ii],np.nan)
+    if cum:
+        b=_event_rows(df,trig,[-1,0])
+        prev_ok=(b[:,0]>=0)&np.isfinite(v[np.maximum(b[:,0],0)])
+        bi=np.where(prev_ok,b[:,0],b[:,1]); vb=np.where(bi>=0,v[np.maximum(bi,0)],np.nan)
+        ok&=np.isfinite(vb)[:,None]&np.isfinite(vv)
+        raw=vv-vb[:,None]
+        val=np.maximum(raw,0.0)
+        dd=(D[ii]-D[np.maximum(bi,0)][:,None,:])*(raw>=0.0)[...,None]
+    else:
+        ok&=np.isfinite(vv); val=vv; dd=D[ii]
+    n=ok.sum(axis=0)
+    with np.errstate(invalid="ignore"):
+        mean=np.where(ok,val,0.0).sum(axis=0)/np.where(n>0,n,np.nan)
+        dmean=np.where(ok[...,None],dd,0.0).sum(axis=0)/np.where(n>0,n,np.nan)[:,None]
+    return mean,dmean,n
+
+def sens_curves(df_obs, evA, S_obs, S_cf, tag):
+    """Per-lag d/d(param) of cum_obs, cum_cf, cum_delta and of the zero-aligned B/C/D deltas."""
+    keys=[c.split("__",1)[1] for c in S_cf.columns if c.startswith("dE_hat_doA0__")]
+    df=df_obs.copy()
+    for c in [B_HAT_CF,C_HAT_CF,D_HAT_CF,E_HAT_CF]: df[c]=S_cf[c].to_numpy()
+    lags=np.arange(LAG_PRE,LAG_POST+1,dtype=int); P=len(keys)
+    base=pd.DataFrame({"tag":tag,"lag":np.repeat(lags,P),"param":np.tile(keys,lags.size)})
+
+    g=lambda S,pref: S[[f"{pref}__{k}" for k in keys]].to_numpy(np.float64)
+    mo,do_,_=_sens_align(df,evA,E_HAT,g(S_obs,"dE_hat"),cum=True)
+    mc,dc,_=_sens_align(df,evA,E_HAT_CF,g(S_cf,"dE_hat_doA0"),cum=True)
+    ae=base.assign(dcum_obs=do_.ravel(),dcum_cf=dc.ravel(),dcum_delta=(do_-dc).ravel())
+    delta=mo-mc; fin=np.isfinite(delta)
+    ddelta=np.where(fin[:,None],do_-dc,0.0)
+    met=pd.DataFrame({"tag":tag,"param":keys,"dDeltaAUC":ddelta.sum(axis=0),
+                      "dDeltaMax":(do_-dc)[int(np.nanargmax(delta))] if fin.any() else np.full(P,np.nan)})
+
+    bcd=base.copy()
+    for node,vo,vc in [("B",B_HAT,B_HAT_CF),("C",C_HAT,C_HAT_CF),("D",D_HAT,D_HAT_CF)]:
+        m1,d1,n1=_sens_align(df,evA,vo,g(S_obs,f"d{node}_hat"),cum=False)
+        m2,d2,n2=_sens_align(df,evA,vc,g(S_cf,f"d{node}_hat_doA0"),cum=False)
+        dd=d1-d2
+        z=np.flatnonzero(lags==-1)
+        if z.size and np.isfinite(m1[z[0]]) and np.isfinite(m2[z[0]]): dd=dd-dd[z[0]]   # _pair's offset at lag -1
+        bcd[f"d{node}_obs"]=d1.ravel(); bcd[f"d{node}_cf"]=d2.ravel(); bcd[f"ddelta_{node}"]=dd.ravel()
+    return ae,bcd,met
+
+def _pair_curves(o, c, obs_name, cf_name, zero_align_at=-1):
     z = o.merge(c, on="lag", suffixes=("_obs", "_cf"))
     if zero_align_at is not None and (z["lag"] == zero_align_at).any():
         rowz = z.loc[z["lag"] == zero_align_at].iloc[0]
@@ -120,7 +329,7 @@ def _pair(df, evA, v_obs, v_cf, taglbl, obs_name, cf_name, zero_align_at=-1):
     z["delta"] = z["mean_obs"] - z["mean_cf"]
     return z.rename(columns={"mean_obs": obs_name, "mean_cf": cf_name})
 
-def _process_one_do(do_path: str, df_obs: pd.DataFrame, evA: pd.DataFrame) -> dict:
+def _process_one_do(do_path: str, df_obs: pd.DataFrame, evA: pd.DataFrame, rk=None, order=None) -> dict:
     df_do = pd.read_csv(do_path, dtype={"run_tag": str}, keep_default_na=False) \
            .sort_values([ID_COL, T_COL]).reset_index(drop=True)
     _need(df_do, [ID_COL, T_COL, B_HAT_CF, C_HAT_CF, D_HAT_CF, E_HAT_CF, "run_tag"], os.path.basename(do_path))
@@ -128,27 +337,109 @@ def _process_one_do(do_path: str, df_obs: pd.DataFrame, evA: pd.DataFrame) -> di
     if not np.array_equal(df_obs[[ID_COL, T_COL]].to_numpy(),
                           df_do [[ID_COL, T_COL]].to_numpy()):
         raise RuntimeError(f"key mismatch between observed and {os.path.basename(do_path)}")
-    df = df_obs.copy()
-    for c in [B_HAT_CF, C_HAT_CF, D_HAT_CF, E_HAT_CF]:
-        df[c] = df_do[c].to_numpy()
-    cf_E = align_cum_rebased(df, evA, E_HAT_CF, LAG_PRE, LAG_POST, f"A->E cf ({tag})")
+    lags = np.arange(LAG_PRE, LAG_POST + 1, dtype=int)
+    series = {c: (df_obs[c].to_numpy(np.float64), False) for c in [B_HAT, C_HAT, D_HAT]}
+    series.update({c: (df_do[c].to_numpy(np.float64), c == E_HAT_CF) for c in [B_HAT_CF, C_HAT_CF, D_HAT_CF, E_HAT_CF]})
+    acc = _stream_align(df_obs, evA, lags, series, tag, rk, order)
+    return _tag_result(tag, acc, acc, lags)
+
+def _tag_result(tag, obs_acc, cf_acc, lags) -> dict:
+    """Curves of one tag from the observed B/C/D and do(A=0) accumulators."""
+    f = lambda a: _acc_frame(a, lags)
+    cf_E = f(cf_acc[E_HAT_CF])
+    tb = _pair_curves(f(obs_acc[B_HAT]), f(cf_acc[B_HAT_CF]), "B_obs", "B_cf")
+    tc = _pair_curves(f(obs_acc[C_HAT]), f(cf_acc[C_HAT_CF]), "C_obs", "C_cf")
+    td = _pair_curves(f(obs_acc[D_HAT]), f(cf_acc[D_HAT_CF]), "D_obs", "D_cf")
     cf_E = cf_E.rename(columns={"mean": "cum_cf"})[["lag", "cum_cf"]]
     cf_E["tag"] = tag
-    tb = _pair(df, evA, B_HAT, B_HAT_CF, f"A->B ({tag})", "B_obs", "B_cf")
-    tc = _pair(df, evA, C_HAT, C_HAT_CF, f"A->C ({tag})", "C_obs", "C_cf")
-    td = _pair(df, evA, D_HAT, D_HAT_CF, f"A->D ({tag})", "D_obs", "D_cf")
     tb = tb.rename(columns={"delta": "delta_B", "n_obs": "nB_obs", "n_cf": "nB_cf"})
     tc = tc.rename(columns={"delta": "delta_C", "n_obs": "nC_obs", "n_cf": "nC_cf"})
     td = td.rename(columns={"delta": "delta_D", "n_obs": "nD_obs", "n_cf": "nD_cf"})
     abcd = (tb.merge(tc, on="lag").merge(td, on="lag"))
     abcd["tag"] = tag
-    return {"tag": tag, "cf_E": cf_E, "abcd": abcd}
+    stats = pd.concat([_acc_stats(cf_acc[c], lags).assign(tag=tag, series=c)
+                       for c in [B_HAT_CF, C_HAT_CF, D_HAT_CF, E_HAT_CF]], ignore_index=True)
+    return {"tag": tag, "cf_E": cf_E, "abcd": abcd, "stats": stats}
+
+def _load_do_stack(df_obs: pd.DataFrame, paths):
+    """
+    (tags, cf) for the do files in paths, cf being (n_tags, 4, rows) B/C/D/E
+    do(A=0) columns in df_obs row order. Taken from IN_DO_ALL in one read
+    when 63_01 wrote it, else file by file.
+    """
+    if os.path.isfile(IN_DO_ALL):
+        df_all = pd.read_csv(IN_DO_ALL, dtype={"run_tag": str}, keep_default_na=False)
+        _need(df_all, [ID_COL, T_COL, B_HAT_CF, C_HAT_CF, D_HAT_CF, E_HAT_CF, "run_tag"], os.path.basename(IN_DO_ALL))
+        groups = dict(tuple(df_all.groupby("run_tag", sort=False)))
+        want = [os.path.basename(p).split("_do__", 1)[1][:-len(".csv")] for p in paths]
+        frames = [(IN_DO_ALL, groups[t]) for t in want if t in groups]
+    else:
+        frames = [(p, pd.read_csv(p, dtype={"run_tag": str}, keep_default_na=False)) for p in paths if os.path.isfile(p)]
+    tags, cf = [], []
+    for src, g in frames:
+        g = g.sort_values([ID_COL, T_COL]).reset_index(drop=True)
+        _need(g, [ID_COL, T_COL, B_HAT_CF, C_HAT_CF, D_HAT_CF, E_HAT_CF, "run_tag"], os.path.basename(src))
+        if not np.array_equal(df_obs[[ID_COL, T_COL]].to_numpy(), g[[ID_COL, T_COL]].to_numpy()):
+            raise RuntimeError(f"key mismatch between observed and {os.path.basename(src)}")
+        tags.append(str(g["run_tag"].iloc[0]))
+        cf.append(g[[B_HAT_CF, C_HAT_CF, D_HAT_CF, E_HAT_CF]].to_numpy(np.float64).T)
+    return tags, (np.stack(cf) if cf else np.zeros((0, 4, len(df_obs))))
+
+def _process_fused(df_obs: pd.DataFrame, evA: pd.DataFrame, tags, cf: np.ndarray) -> list:
+    """
+    _process_one_do for every tag at once: onsets stream through one gather
+    per chunk, which feeds the observed B/C/D/E accumulators and each tag's
+    four do(A=0) accumulators. Returns (per-tag results, observed accs).
+    """
+    lags = np.arange(LAG_PRE, LAG_POST + 1, dtype=int)
+    series = {c: (df_obs[c].to_numpy(np.float64), c == E_HAT) for c in [B_HAT, C_HAT, D_HAT, E_HAT]}
+    cols = [B_HAT_CF, C_HAT_CF, D_HAT_CF, E_HAT_CF]
+    for k, tag in enumerate(tags):
+        series.update({(tag, c): (cf[k, j], c == E_HAT_CF) for j, c in enumerate(cols)})
+    acc = _stream_align(df_obs, evA, lags, series, "fused")
+    out = [_tag_result(tag, acc, {c: acc[(tag, c)] for c in cols}, lags) for tag in tags]
+    print(f"[62_06] fused align {len(tags)} tags", flush=True)
+    return out, {c: acc[c] for c in [B_HAT, C_HAT, D_HAT, E_HAT]}
+
+def _share_cohort(df_obs: pd.DataFrame, evA: pd.DataFrame, folder: str):
+    """
+    Write the observed columns, the A onsets, and the row key and event order
+    the gather needs once as .npy files for the workers to map, so no worker
+    rebuilds them.
+    """
+    for c in COHORT_COLS: np.save(os.path.join(folder, f"obs__{c}.npy"), df_obs[c].to_numpy())
+    for c in [ID_COL, "t0"]: np.save(os.path.join(folder, f"evA__{c}.npy"), evA[c].to_numpy())
+    rk = _row_key(df_obs)
+    if rk is not None:
+        uniq, key, tmin, span = rk
+        np.save(os.path.join(folder, "rk__uniq.npy"), uniq); np.save(os.path.join(folder, "rk__key.npy"), key)
+        np.save(os.path.join(folder, "rk__meta.npy"), np.array([tmin, span], dtype=np.int64))
+    np.save(os.path.join(folder, "evA__order.npy"), _event_order(evA))
+
+def _attach_cohort(folder: str):
+    """
+    Pool initializer: map the shared cohort read-only. The pages live once in
+    the page cache however many workers attach, and DataFrame(copy=False)
+    keeps the columns as views of the maps.
+    """
+    global _SHARED
+    ld = lambda n: np.load(os.path.join(folder, f"{n}.npy"), mmap_mode="r")
+    rk = None
+    if os.path.isfile(os.path.join(folder, "rk__meta.npy")):
+        tmin, span = (int(v) for v in ld("rk__meta"))
+        rk = (ld("rk__uniq"), ld("rk__key"), tmin, span)
+    _SHARED = (pd.DataFrame({c: ld(f"obs__{c}") for c in COHORT_COLS}, copy=False),
+               pd.DataFrame({c: ld(f"evA__{c}") for c in [ID_COL, "t0"]}, copy=False),
+               rk, ld("evA__order"))
+
+def _process_shared(do_path: str) -> dict:
+    return _process_one_do(do_path, *_SHARED)
 
 # ===== main =====
 def main():
     import multiprocessing as mp
     t0 = time.time()
-    print("[62_06] start (parallel)", flush=True)
+    print(f"[62_06] start ({'fused' if FUSED else 'parallel'})", flush=True)
 
     need_f = [ID_COL, T_COL, A_LOW, B_FLAG, C_FLAG, D_FLAG, E_FLAG]
     cols_f = pd.read_csv(IN_FLAGS_CSV, nrows=0).columns.tolist()
@@ -171,17 +462,36 @@ def main():
     evA = extract_onsets(df_obs, A_LOW)
     if evA.empty: raise RuntimeError("no A_low onsets detected")
 
-    obs_E = align_cum_rebased(df_obs, evA, E_HAT, LAG_PRE, LAG_POST, "A->E obs (ALL-ref)")
-    obs_E = obs_E.rename(columns={"mean": "cum_obs"})[["lag", "cum_obs"]]
+    lags = np.arange(LAG_PRE, LAG_POST + 1, dtype=int)
 
-    do_list = [p for p in DO_FILES if os.path.isfile(p)]
-    if len(do_list) == 0:
-        raise FileNotFoundError("no DO files found (propagation)")
-    args = [(p, df_obs, evA) for p in do_list]
-    ncpu = max(1, mp.cpu_count() - 1)
-    print(f"workers = {ncpu}", flush=True)
-    with mp.get_context("spawn").Pool(processes=ncpu) as pool:
-        results = pool.starmap(_process_one_do, args)
+    os.makedirs(OUT63_DIR, exist_ok=True)
+    if FUSED:
+        tags, cf = _load_do_stack(df_obs, DO_FILES + DO_FILES_EONLY)
+        res, obs_acc = _process_fused(df_obs, evA, tags, cf)
+        eonly = {os.path.basename(p).split("_do__", 1)[1][:-len(".csv")] for p in DO_FILES_EONLY}
+        results = [r for r in res if r["tag"] not in eonly]
+        results_e = [r for r in res if r["tag"] in eonly]
+        if len(results) == 0:
+            raise FileNotFoundError("no DO files found (propagation)")
+    else:
+        do_list = [p for p in DO_FILES if os.path.isfile(p)]
+        if len(do_list) == 0:
+            raise FileNotFoundError("no DO files found (propagation)")
+        do_e = [p for p in DO_FILES_EONLY if os.path.isfile(p)]
+        ncpu = max(1, mp.cpu_count() - 1)
+        print(f"workers = {ncpu}", flush=True)
+        # workers get only a do path; the cohort is shared through read-only maps
+        share = tempfile.mkdtemp(prefix=".6302_shared_", dir=OUT63_DIR)
+        try:
+            _share_cohort(df_obs, evA, share)
+            with mp.get_context("spawn").Pool(processes=ncpu, initializer=_attach_cohort, initargs=(share,)) as pool:
+                results = pool.map(_process_shared, do_list)
+                results_e = pool.map(_process_shared, do_e) if do_e else []
+        finally:
+            shutil.rmtree(share, ignore_errors=True)
+        obs_acc = _stream_align(df_obs, evA, lags, {c: (df_obs[c].to_numpy(np.float64), c == E_HAT)
+                                                     for c in [B_HAT, C_HAT, D_HAT, E_HAT]}, "observed")
+    obs_E = _acc_frame(obs_acc[E_HAT], lags).rename(columns={"mean": "cum_obs"})[["lag", "cum_obs"]]
 
     ae_rows, abcd_rows, met_rows = [], [], []
     for out in results:
@@ -206,13 +516,17 @@ def main():
     abcd_all = pd.concat(abcd_rows, ignore_index=True).sort_values(["tag","lag"]).reset_index(drop=True)
     metrics  = pd.DataFrame(met_rows, columns=["tag","DeltaAUC","DeltaMax","LagOnset"]).sort_values("DeltaAUC", ascending=False)
 
-    os.makedirs(OUT63_DIR, exist_ok=True)
     ae_all.to_csv(OUT_AE_ALL, index=False)
     abcd_all.to_csv(OUT_ABCD_ALL, index=False)
     metrics.to_csv(OUT_AE_METRICS, index=False)
+    stats = [_acc_stats(a, lags).assign(tag="observed", series=c) for c, a in obs_acc.items()]
+    stats += [r["stats"] for r in results + results_e]
+    stats = pd.concat(stats, ignore_index=True)
+    stats[["tag", "series"] + [c for c in stats.columns if c not in ("tag", "series")]].to_csv(OUT_ALIGN_STATS, index=False)
     print(f" saved -> {OUT_AE_ALL}")
     print(f" saved -> {OUT_ABCD_ALL}")
     print(f" saved -> {OUT_AE_METRICS}")
+    print(f" saved -> {OUT_ALIGN_STATS}")
 
     first = ae_all["tag"].unique()[0]
     ae_all[ae_all["tag"] == first][["lag", "cum_obs", "cum_cf", "cum_delta"]].to_csv(OUT_AE_SINGLE, index=False)
@@ -220,14 +534,10 @@ def main():
     print(f" saved -> {OUT_AE_SINGLE}")
     print(f" saved -> {OUT_ABCD_SINGLE}")
 
-    do_e = [p for p in DO_FILES_EONLY if os.path.isfile(p)]
-    if len(do_e) == 0:
+    if len(results_e) == 0:
         print(" skip E-only (no E-only DO files found)", flush=True)
     else:
         print(" E-only aggregation ...", flush=True)
-        args_e = [(p, df_obs, evA) for p in do_e]
-        with mp.get_context("spawn").Pool(processes=ncpu) as pool:
-            results_e = pool.starmap(_process_one_do, args_e)
         rows_e = []
         for out in results_e:
             tag = out["tag"]
@@ -239,6 +549,30 @@ def main():
         ae_eonly_all.to_csv(OUT_AE_EONLY_ALL, index=False)
         print(f" saved -> {OUT_AE_EONLY_ALL}")
 
+    sens_list = [p for p in SENS_FILES if os.path.isfile(p)]
+    if os.path.isfile(IN_SENS_OBS) and sens_list:
+        print(" sensitivity aggregation ...", flush=True)
+        S_obs = pd.read_csv(IN_SENS_OBS).sort_values([ID_COL, T_COL]).reset_index(drop=True)
+        if not np.array_equal(df_obs[[ID_COL, T_COL]].to_numpy(), S_obs[[ID_COL, T_COL]].to_numpy()):
+            raise RuntimeError("key mismatch between observed and 62_observed_sens")
+        ae_s, bcd_s, met_s = [], [], []
+        for p in sens_list:
+            S_cf = pd.read_csv(p, dtype={"run_tag": str}, keep_default_na=False).sort_values([ID_COL, T_COL]).reset_index(drop=True)
+            if not np.array_equal(df_obs[[ID_COL, T_COL]].to_numpy(), S_cf[[ID_COL, T_COL]].to_numpy()):
+                raise RuntimeError(f"key mismatch between observed and {os.path.basename(p)}")
+            do_path = os.path.join(OUT63_DIR, os.path.basename(p).replace("631_sens__", "631_do__"))
+            df_do = pd.read_csv(do_path, dtype={"run_tag": str}, keep_default_na=False).sort_values([ID_COL, T_COL]).reset_index(drop=True)
+            for c in [B_HAT_CF, C_HAT_CF, D_HAT_CF, E_HAT_CF]:
+                S_cf[c] = df_do[c].to_numpy()
+            a, b, m = sens_curves(df_obs, evA, S_obs, S_cf, str(S_cf["run_tag"].iloc[0]))
+            ae_s.append(a); bcd_s.append(b); met_s.append(m)
+        pd.concat(ae_s, ignore_index=True).to_csv(OUT_SENS_AE, index=False)
+        pd.concat(bcd_s, ignore_index=True).to_csv(OUT_SENS_BCD, index=False)
+        pd.concat(met_s, ignore_index=True).to_csv(OUT_SENS_METRICS, index=False)
+        print(f" saved -> {OUT_SENS_AE}")
+        print(f" saved -> {OUT_SENS_BCD}")
+        print(f" saved -> {OUT_SENS_METRICS}")
+
     print(f" done in {time.time()-t0:.1f}s", flush=True)
 
 if __name__ == "__main__":
@@ -42,6 +42,7 @@ def load_params_yaml(fp: Path):
         for parent in ["A","B","C","D"]:
             key = f"kappa_{parent}"
             kap[k][parent] = float(eff[k].get(key, 0.0))
+        kap[k]["phi"] = float(eff[k].get("phi", 0.0))     # AR(1) persistence of the node itself
     return kap
 
 def parents_of(node: str):
@@ -61,12 +62,16 @@ def step_update(prev: dict, a_tminus1: float, kap: dict, drop_edge=None, noneE=F
             if drop_edge == (u, node):
                 continue
             infl += kap[node].get(u, 0.0) * (prev[u] - 0.0)
+        if kap[node].get("phi", 0.0):
+            infl += kap[node]["phi"] * prev[node]
         nxt[node] = infl
     infl_E = 0.0
     for u in parents_of("E"):
         if noneE or drop_edge == (u, "E"):
             continue
         infl_E += kap["E"].get(u, 0.0) * (prev[u] - 0.0)
+    if kap["E"].get("phi", 0.0):                     # persistence is not an edge: kept under NoneE
+        infl_E += kap["E"]["phi"] * prev["E"]
     nxt["E"] = infl_E
     return nxt
 